@@ -0,0 +1,193 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+from config import Config
+from extractor_pool import StreamInfo
+
+
+class AudioCache:
+    """On-disk Ogg/Opus copies of frequently played tracks, bounded by total bytes.
+
+    Play counts live in SQLite next to the files. Once a track has been played
+    `min_plays` times it is downloaded in the background (Opus streams are
+    remuxed without re-encoding), and later plays are served from the local
+    file. The least recently played files are evicted to stay under `max_bytes`.
+    """
+
+    def __init__(self, resolve: Callable[[str], Awaitable], directory: str = None,
+                 max_bytes: int = None, min_plays: int = None, ffmpeg: str = 'ffmpeg'):
+        self.resolve = resolve
+        self.directory = directory or Config.AUDIO_CACHE_DIR
+        self.max_bytes = Config.AUDIO_CACHE_SIZE_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.min_plays = min_plays or Config.AUDIO_CACHE_MIN_PLAYS
+        self.ffmpeg = ffmpeg
+
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._populating: Set[str] = set()
+        self._semaphore = asyncio.Semaphore(Config.AUDIO_CACHE_CONCURRENCY)
+        self._db = self._open_db() if self.enabled else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _open_db(self) -> Optional[sqlite3.Connection]:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            db = sqlite3.connect(os.path.join(self.directory, 'index.db'), check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS audio_cache ("
+                "video_id TEXT PRIMARY KEY, plays INTEGER NOT NULL DEFAULT 0, "
+                "size INTEGER, last_played REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS audio_cache_last_played ON audio_cache(last_played)")
+            db.commit()
+            return db
+        except Exception as e:
+            print(f"Audio cache disabled ({self.directory}): {e}")
+            return None
+
+    def _path(self, video_id: str) -> str:
+        return os.path.join(self.directory, f"{video_id}.ogg")
+
+    async def lookup(self, video_id: str) -> Optional[StreamInfo]:
+        """Return a local stream for a cached track, or None (the index is read in a worker thread)."""
+        if self._db is None:
+            return None
+        return await asyncio.to_thread(self._find, video_id)
+
+    def _find(self, video_id: str) -> Optional[StreamInfo]:
+        path = self._path(video_id)
+        with self._lock:
+            if self._db is None:
+                return None
+            row = self._db.execute("SELECT size FROM audio_cache WHERE video_id = ?", (video_id,)).fetchone()
+            if row is None or row[0] is None:
+                return None
+            if not os.path.exists(path):
+                # File removed behind our back; forget it so it can be fetched again
+                self._db.execute("UPDATE audio_cache SET size = NULL WHERE video_id = ?", (video_id,))
+                self._db.commit()
+                return None
+        return StreamInfo(path, 'opus', 'ogg')
+
+    async def record_play(self, video_id: str, url: str):
+        """Count a play; start a background download once the track is hot enough."""
+        if self._db is None:
+            return
+        plays, size = await asyncio.to_thread(self._count_play, video_id)
+        if size is None and plays >= self.min_plays and video_id not in self._populating:
+            self._populating.add(video_id)
+            asyncio.get_running_loop().create_task(self._populate(video_id, url))
+
+    def _count_play(self, video_id: str) -> Tuple[int, Optional[int]]:
+        """Add a play to the index; returns (plays, cached file size or None)."""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO audio_cache (video_id, plays, last_played) VALUES (?, 1, ?) "
+                "ON CONFLICT(video_id) DO UPDATE SET plays = plays + 1, last_played = excluded.last_played",
+                (video_id, time.time()),
+            )
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= 100:
+                self._prune_counts()
+            self._db.commit()
+            return self._db.execute(
+                "SELECT plays, size FROM audio_cache WHERE video_id = ?", (video_id,)
+            ).fetchone()
+
+    def _prune_counts(self):
+        """Forget play counts of uncached tracks nobody has played for a while."""
+        self._writes_since_prune = 0
+        self._db.execute(
+            "DELETE FROM audio_cache WHERE size IS NULL AND last_played < ?",
+            (time.time() - Config.AUDIO_CACHE_PLAY_WINDOW,),
+        )
+
+    async def _populate(self, video_id: str, url: str):
+        try:
+            async with self._semaphore:
+                stream = await self.resolve(url)
+                if stream is None or stream.is_local:
+                    return
+                size = await self._download(stream, self._path(video_id))
+            if size is not None:
+                await asyncio.to_thread(self._store, video_id, size)
+        except Exception as e:
+            print(f"Error caching audio for {video_id}: {e}")
+        finally:
+            self._populating.discard(video_id)
+
+    async def _download(self, stream: StreamInfo, path: str) -> Optional[int]:
+        """Save a stream as Ogg/Opus; returns the file size, or None on failure."""
+        # Cluster workers share the directory and may fetch the same track at once; the rename is atomic
+        tmp_path = f"{path}.{os.getpid()}.part"
+        codec = ['-c:a', 'copy'] if stream.is_opus else ['-c:a', 'libopus', '-b:a', '128k']
+        process = await asyncio.create_subprocess_exec(
+            self.ffmpeg, '-nostdin', '-loglevel', 'error', '-y',
+            '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+            '-i', stream.url, '-vn', *codec, '-f', 'ogg', tmp_path,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            print(f"ffmpeg failed caching {path}: {stderr.decode(errors='replace').strip()[-300:]}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def _store(self, video_id: str, size: int):
+        """Record a downloaded file, then evict to stay within the byte budget."""
+        with self._lock:
+            self._db.execute("UPDATE audio_cache SET size = ? WHERE video_id = ?", (size, video_id))
+            self._db.commit()
+        self._evict()
+
+    def _evict(self):
+        """Delete least recently played files until the cache fits its byte budget."""
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM audio_cache").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = self._db.execute(
+                "SELECT video_id, size FROM audio_cache WHERE size IS NOT NULL ORDER BY last_played"
+            ).fetchall()
+            for video_id, size in rows:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self._path(video_id))
+                except FileNotFoundError:
+                    pass
+                self._db.execute("UPDATE audio_cache SET size = NULL WHERE video_id = ?", (video_id,))
+                total -= size
+            self._db.commit()
+
+    def stats(self) -> Dict:
+        if self._db is None:
+            return {'enabled': False}
+        with self._lock:
+            files, total = self._db.execute(
+                "SELECT COUNT(size), COALESCE(SUM(size), 0) FROM audio_cache"
+            ).fetchone()
+        return {
+            'enabled': True,
+            'files': files,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'populating': len(self._populating),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,4 @@
+"""Offline benchmarks for the bot's API, queue and radio code paths.
+
+Run from the repository root with `python -m benchmarks.run`.
+"""
@@ -0,0 +1,317 @@
+"""Run the offline benchmarks and emit the results as JSON.
+
+    python -m benchmarks.run [--quick] [--latency MS] [--output results.json]
+
+Nothing leaves the machine: the Data API is served by a local stub server,
+YTMusic and the yt-dlp extractor are replaced with fakes, and every on-disk
+store (caches, queues, quota) lives in a temporary directory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List
+
+_SCRATCH = tempfile.mkdtemp(prefix='musicbot-bench-')
+
+# Config reads the environment at import time, so redirect it before importing the bot
+os.environ.update({
+    'DISCORD_TOKEN': 'benchmark',
+    'YOUTUBE_API_KEY': 'benchmark',
+    'DISCORD_GUILD_ID': '0',
+    'DATA_DIR': os.path.join(_SCRATCH, 'data'),
+    'LEGACY_QUEUE_FILE': os.path.join(_SCRATCH, 'queue.json'),
+    'SEARCH_CACHE_PATH': os.path.join(_SCRATCH, 'search_cache.db'),
+    'RELATED_GRAPH_PATH': os.path.join(_SCRATCH, 'related.db'),
+    'QUOTA_STATE_PATH': os.path.join(_SCRATCH, 'quota.json'),
+    'YTDL_CACHE_DIR': os.path.join(_SCRATCH, 'yt-dlp-cache'),
+    'TRACK_INDEX_PATH': os.path.join(_SCRATCH, 'tracks.db'),
+    # Loudness analysis would run ffmpeg against the fake stream URLs
+    'LOUDNESS_TARGET': '0',
+    'QUOTA_DAILY_LIMIT': str(10 ** 9),
+    'METRICS_PORT': '0',
+})
+
+import discord_bot  # noqa: E402
+import youtube_api  # noqa: E402
+from benchmarks.stubs import FakeExtractor, FakeYTMusic, StubYouTubeServer, fake_video_id  # noqa: E402
+from stream_cache import StreamPrefetcher  # noqa: E402
+from track_queue import Track  # noqa: E402
+
+
+class FakeChannel:
+    id = 0
+
+    async def send(self, *args, **kwargs):
+        return None
+
+
+class FakeContext:
+    """Just enough of commands.Context for player code that reports to a channel."""
+    channel = FakeChannel()
+
+    async def send(self, *args, **kwargs):
+        return None
+
+
+def _summary(name: str, params: Dict, samples: List[float], wall: float) -> Dict:
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))] * 1000
+
+    return {
+        'name': name,
+        'params': params,
+        'iterations': len(samples),
+        'ops_per_sec': len(samples) / wall if wall else None,
+        'mean_ms': statistics.fmean(samples) * 1000,
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+        'min_ms': ordered[0] * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def bench(name: str, fn: Callable[[int], object], iterations: int, **params) -> Dict:
+    """Time `fn(i)` for i in range(iterations)."""
+    samples = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - t0)
+    return _summary(name, params, samples, time.perf_counter() - started)
+
+
+async def abench(name: str, fn: Callable[[int], Awaitable], iterations: int, **params) -> Dict:
+    """Time `await fn(i)` for i in range(iterations), one call at a time."""
+    samples = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        await fn(i)
+        samples.append(time.perf_counter() - t0)
+    return _summary(name, params, samples, time.perf_counter() - started)
+
+
+async def abench_concurrent(name: str, fn: Callable[[int], Awaitable], iterations: int,
+                            concurrency: int, **params) -> Dict:
+    """Run `fn(i)` with `concurrency` calls in flight; latency is per call."""
+    samples = []
+
+    async def timed(i: int):
+        t0 = time.perf_counter()
+        await fn(i)
+        samples.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    for start in range(0, iterations, concurrency):
+        await asyncio.gather(*(timed(i) for i in range(start, min(iterations, start + concurrency))))
+    return _summary(name, params, samples, time.perf_counter() - started)
+
+
+def make_tracks(count: int, prefix: str = 'q') -> List[Track]:
+    return [
+        Track(fake_video_id(f"{prefix}:{i}"), f"Song {i}", f"Artist {i % 50}", '', 150 + i % 200, 'bench')
+        for i in range(count)
+    ]
+
+
+async def api_benchmarks(api, sync_api, iterations: int, latency: float) -> List[Dict]:
+    results = []
+    run = f"{time.time_ns()}"
+    common = {'latency_ms': latency * 1000}
+
+    results.append(await abench(
+        'api.search_song.cold', lambda i: api.search_song(f"cold {run} {i}", max_results=5), iterations, **common
+    ))
+    results.append(await abench(
+        'api.search_song.cached', lambda i: api.search_song(f"cold {run} 0", max_results=5), iterations, **common
+    ))
+    results.append(await abench_concurrent(
+        'api.search_song.concurrent', lambda i: api.search_song(f"burst {run} {i}", max_results=5),
+        iterations, concurrency=20, **common
+    ))
+    results.append(await abench(
+        'api.get_video_info.cold', lambda i: api.get_video_info(fake_video_id(f"info {run} {i}")),
+        iterations, **common
+    ))
+    results.append(await abench(
+        'api.get_related_songs.cold',
+        lambda i: api.get_related_songs(fake_video_id(f"seed {run} {i}"), max_results=5), iterations, **common
+    ))
+    results.append(await abench(
+        'api.get_related_songs.graph', lambda i: api.get_related_songs(fake_video_id(f"seed {run} 0"), max_results=5),
+        iterations, **common
+    ))
+
+    def sync_search(i: int):
+        sync_api.search_song(f"sync {run} {i}", max_results=5)
+
+    # The blocking client must not run on the loop that serves the stub
+    results.append(await asyncio.to_thread(
+        bench, 'api.sync.search_song.cold', sync_search, iterations, **common
+    ))
+    return results
+
+
+async def stream_benchmarks(iterations: int, latency: float) -> List[Dict]:
+    prefetcher = StreamPrefetcher(FakeExtractor(latency).extract_stream)
+    url = 'https://www.youtube.com/watch?v={}'
+    return [
+        await abench('stream.get_stream.cold', lambda i: prefetcher.get_stream(url.format(f"cold{i}")),
+                     iterations, latency_ms=latency * 1000),
+        await abench('stream.get_stream.cached', lambda i: prefetcher.get_stream(url.format('cold0')),
+                     iterations, latency_ms=latency * 1000),
+    ]
+
+
+def new_player(bot, guild_id: int, tracks: List[Track]):
+    player = discord_bot.GuildPlayer(bot, guild_id)
+    player.queue.extend(tracks)
+    return player
+
+
+async def queue_benchmarks(bot, sizes: List[int], iterations: int) -> List[Dict]:
+    results = []
+    for n, size in enumerate(sizes):
+        player = new_player(bot, 1000 + n, make_tracks(size))
+        extra = make_tracks(1, prefix='extra')[0]
+
+        def enqueue_pop(i: int):
+            player.enqueue(extra)
+            player.pop_next()
+
+        def move_head_to_tail(i: int):
+            player.move(0, len(player.queue) - 1)
+
+        def move_middle(i: int):
+            middle = len(player.queue) // 2
+            player.move(middle, 0)
+
+        def remove_insert_middle(i: int):
+            track = player.remove_at(len(player.queue) // 2)
+            player.enqueue(track)
+
+        results.append(bench('queue.enqueue_pop', enqueue_pop, iterations, size=size))
+        results.append(bench('queue.move_head_to_tail', move_head_to_tail, iterations, size=size))
+        results.append(bench('queue.move_middle_to_head', move_middle, iterations, size=size))
+        results.append(bench('queue.remove_middle_append', remove_insert_middle, iterations, size=size))
+        results.append(bench('queue.shuffle', lambda i: player.shuffle(), max(1, iterations // 10), size=size))
+        results.append(bench('queue.create_queue_embed',
+                             lambda i: discord_bot.create_queue_embed(player.queue), iterations, size=size))
+        await player.journal.flush()
+    return results
+
+
+async def radio_benchmarks(bot, sizes: List[int], iterations: int) -> List[Dict]:
+    results = []
+    ctx = FakeContext()
+    run = f"{time.time_ns()}"
+    for n, size in enumerate(sizes):
+        player = new_player(bot, 2000 + n, make_tracks(size))
+        player.radio_mode = True
+
+        async def refill(seed_prefix: str, i: int):
+            player.history.clear()
+            player.history.extend(make_tracks(3, prefix=f"{seed_prefix}:{i}"))
+            added = await player._refill_radio(ctx)
+            # Drop what was added so every iteration refills the same queue
+            for _ in range(added):
+                player.remove_at(len(player.queue) - 1)
+
+        results.append(await abench('radio.refill.cold', lambda i: refill(f"cold {run} {size}", i),
+                                    iterations, size=size))
+        results.append(await abench('radio.refill.graph', lambda i: refill(f"warm {run} {size}", 0),
+                                    iterations, size=size))
+        await player.journal.flush()
+    return results
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+async def run_all(args) -> Dict:
+    latency = args.latency / 1000
+    iterations = 20 if args.quick else 200
+    sizes = [10, 1000] if args.quick else [10, 1000, 10000, 100000]
+
+    server = StubYouTubeServer(latency)
+    await server.start()
+    bot = discord_bot.bot
+    # The player code schedules tasks on bot.loop, which discord.py only sets once logged in
+    bot.loop = asyncio.get_running_loop()
+    await bot.youtube_api.close()
+    api = youtube_api.AsyncYouTubeMusicAPI()
+    api.base_url = server.base_url
+    api.ytmusic = FakeYTMusic(latency)
+    sync_api = youtube_api.YouTubeMusicAPI()
+    sync_api.base_url = server.base_url
+    sync_api.ytmusic = FakeYTMusic(latency)
+    bot.youtube_api = api
+    bot.prefetcher = StreamPrefetcher(FakeExtractor(latency).extract_stream)
+
+    results = []
+    try:
+        results += await api_benchmarks(api, sync_api, iterations, latency)
+        results += await stream_benchmarks(iterations, latency)
+        results += await queue_benchmarks(bot, sizes, iterations)
+        results += await radio_benchmarks(bot, sizes, iterations)
+    finally:
+        await api.close()
+        sync_api.search_cache.close()
+        sync_api.related_graph.close()
+        await server.close()
+        bot.extractor_pool.shutdown()
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'quick': args.quick,
+            'latency_ms': args.latency,
+            'stub_requests': server.requests,
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the music bot")
+    parser.add_argument('--quick', action='store_true', help="fewer iterations and queue sizes")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="simulated upstream latency per call, in milliseconds")
+    parser.add_argument('--output', help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    try:
+        report = asyncio.run(run_all(args))
+    finally:
+        shutil.rmtree(_SCRATCH, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
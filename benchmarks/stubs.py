@@ -0,0 +1,136 @@
+"""Local stand-ins for the YouTube Data API, YouTube Music and yt-dlp."""
+import asyncio
+import hashlib
+import socket
+import time
+from typing import Dict, List, Optional
+from aiohttp import web
+from extractor_pool import StreamInfo
+
+
+def fake_video_id(seed: str) -> str:
+    """Deterministic 11-character video ID for a seed string."""
+    return hashlib.sha1(seed.encode('utf-8')).hexdigest()[:11]
+
+
+def _snippet(video_id: str) -> Dict:
+    return {
+        'title': f"Song {video_id}",
+        'channelTitle': f"Artist {video_id[:3]}",
+        'thumbnails': {'medium': {'url': f"https://i.ytimg.com/vi/{video_id}/mqdefault.jpg"}},
+    }
+
+
+class StubYouTubeServer:
+    """aiohttp server answering the Data API `search` and `videos` endpoints.
+
+    Every response is delayed by `latency` seconds to approximate a network
+    round trip. Use `base_url` in place of the real googleapis URL.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests: Dict[str, int] = {'search': 0, 'videos': 0}
+        self.base_url: Optional[str] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/youtube/v3/search', self._search)
+        app.router.add_get('/youtube/v3/videos', self._videos)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        await web.SockSite(self._runner, sock).start()
+        self.base_url = f"http://127.0.0.1:{sock.getsockname()[1]}/youtube/v3"
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _search(self, request: web.Request) -> web.Response:
+        self.requests['search'] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        query = request.query.get('q', '')
+        count = int(request.query.get('maxResults', 5))
+        items = []
+        for i in range(count):
+            video_id = fake_video_id(f"{query}:{i}")
+            items.append({'id': {'kind': 'youtube#video', 'videoId': video_id}, 'snippet': _snippet(video_id)})
+        return web.json_response({'items': items})
+
+    async def _videos(self, request: web.Request) -> web.Response:
+        self.requests['videos'] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        items = []
+        for video_id in filter(None, request.query.get('id', '').split(',')):
+            seconds = 120 + int(video_id[:4], 16) % 240
+            items.append({
+                'id': video_id,
+                'snippet': _snippet(video_id),
+                'contentDetails': {'duration': f"PT{seconds // 60}M{seconds % 60}S"},
+            })
+        return web.json_response({'items': items})
+
+
+class FakeYTMusic:
+    """Replacement for ytmusicapi.YTMusic returning synthetic radio/search results."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def get_watch_playlist(self, videoId: str, limit: int = 25) -> Dict:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        tracks = [{'videoId': videoId, 'title': f"Song {videoId}", 'length': '3:30'}]
+        for i in range(limit):
+            vid = fake_video_id(f"{videoId}:related:{i}")
+            tracks.append({
+                'videoId': vid,
+                'title': f"Song {vid}",
+                'length': f"{2 + i % 4}:{(i * 7) % 60:02d}",
+                'artists': [{'name': f"Artist {vid[:3]}"}],
+                'thumbnail': [{'url': f"https://i.ytimg.com/vi/{vid}/mqdefault.jpg"}],
+            })
+        return {'tracks': tracks}
+
+    def search(self, query: str, filter: str = None, limit: int = 20) -> List[Dict]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        results = []
+        for i in range(limit):
+            vid = fake_video_id(f"{query}:ytm:{i}")
+            results.append({
+                'videoId': vid,
+                'title': f"Song {vid}",
+                'artists': [{'name': f"Artist {vid[:3]}"}],
+                'duration': '3:05',
+                'duration_seconds': 185,
+                'thumbnails': [{'url': f"https://i.ytimg.com/vi/{vid}/mqdefault.jpg"}],
+            })
+        return results
+
+
+class FakeExtractor:
+    """Async stand-in for ExtractorPool.extract_stream returning opus StreamInfo."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.extractions = 0
+
+    async def extract_stream(self, url: str) -> StreamInfo:
+        self.extractions += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        expire = int(time.time()) + 6 * 3600
+        video_id = url.rsplit('=', 1)[-1]
+        return StreamInfo(
+            f"https://rr1---sn-fake.googlevideo.com/videoplayback?id={video_id}&expire={expire}",
+            'opus', 'webm',
+        )
@@ -0,0 +1,415 @@
+import asyncio
+import itertools
+import multiprocessing
+import secrets
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+import metrics
+from config import Config
+from extractor_pool import ExtractorPool, StreamInfo
+from stream_cache import StreamPrefetcher
+from youtube_api import AsyncYouTubeMusicAPI, YouTubeMusicAPI
+
+# Sent by a client to stop a streaming call it no longer reads (e.g. a cancelled playlist import)
+CANCEL = '__cancel__'
+
+# Seconds between restarts of a cluster process that keeps exiting
+RESTART_DELAY = 5
+
+
+class ServiceError(Exception):
+    """An exception raised inside the cluster service, re-raised in the worker."""
+
+
+class ClusterService:
+    """Shared extraction and metadata process for cluster mode.
+
+    Owns the yt-dlp extractor pool, the stream URL cache and the Data API
+    client (with its search cache, related-track graph and quota tracker), so
+    every worker shares one copy of each and only this process writes them.
+    Workers connect over multiprocessing.connection; each connection gets a
+    reader thread and calls run concurrently on this process's event loop.
+    """
+
+    def __init__(self, address: Tuple[str, int], authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self.api: Optional[AsyncYouTubeMusicAPI] = None
+        self.extractor_pool: Optional[ExtractorPool] = None
+        self.prefetcher: Optional[StreamPrefetcher] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._calls: Dict[str, Callable] = {}
+        self._streams: Dict[str, Callable] = {}
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self.api = AsyncYouTubeMusicAPI()
+        await self.api.start()
+        self.extractor_pool = ExtractorPool()
+        self.prefetcher = StreamPrefetcher(self.extractor_pool.extract_stream)
+        self._calls = {
+            'search_song': self.api.search_song,
+            'get_video_info': self.api.get_video_info,
+            'get_related_songs': self.api.get_related_songs,
+            'get_stream': self.prefetcher.get_stream,
+            'invalidate_stream': self._invalidate_stream,
+        }
+        self._streams = {'iter_playlist': self.api.iter_playlist}
+
+        metrics.EXTRACT_QUEUE_DEPTH.set_function(lambda: self.extractor_pool.queue_depth)
+        metrics.QUOTA_REMAINING.set_function(lambda: self.api.quota.remaining)
+        metrics_runner = await metrics.start_server()
+
+        listener = Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self._accept, args=(listener,), name='cluster-accept', daemon=True).start()
+        print(f"Cluster service listening on {self.address[0]}:{self.address[1]}")
+
+        await asyncio.gather(asyncio.to_thread(self.api.warm), self.extractor_pool.warm(), return_exceptions=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            listener.close()
+            await self.api.close()
+            self.extractor_pool.shutdown()
+            if metrics_runner is not None:
+                await metrics_runner.cleanup()
+
+    async def _invalidate_stream(self, url: str):
+        self.prefetcher.invalidate(url)
+
+    def _accept(self, listener: Listener):
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                return
+            except Exception as e:
+                # Failed handshakes (e.g. a wrong authkey) must not stop the service
+                print(f"Rejected cluster connection: {e}")
+                continue
+            threading.Thread(target=self._read, args=(conn,), name='cluster-conn', daemon=True).start()
+
+    def _read(self, conn: Connection):
+        tasks: Dict[int, asyncio.Task] = {}
+        try:
+            while True:
+                message = conn.recv()
+                self._loop.call_soon_threadsafe(self._dispatch, conn, tasks, message)
+        except (EOFError, OSError):
+            pass
+        self._loop.call_soon_threadsafe(self._disconnected, conn, tasks)
+
+    def _dispatch(self, conn: Connection, tasks: Dict[int, asyncio.Task], message):
+        call_id, method, args, kwargs = message
+        if method == CANCEL:
+            task = tasks.pop(call_id, None)
+            if task is not None:
+                task.cancel()
+            return
+        tasks[call_id] = self._loop.create_task(self._run_call(conn, tasks, call_id, method, args, kwargs))
+
+    @staticmethod
+    def _disconnected(conn: Connection, tasks: Dict[int, asyncio.Task]):
+        for task in tasks.values():
+            task.cancel()
+        tasks.clear()
+        conn.close()
+
+    async def _run_call(self, conn: Connection, tasks: Dict[int, asyncio.Task],
+                        call_id: int, method: str, args, kwargs):
+        try:
+            if method in self._streams:
+                async for item in self._streams[method](*args, **kwargs):
+                    self._reply(conn, call_id, 'item', item)
+                self._reply(conn, call_id, 'end', None)
+            elif method in self._calls:
+                self._reply(conn, call_id, 'result', await self._calls[method](*args, **kwargs))
+            else:
+                self._reply(conn, call_id, 'error', f"Unknown cluster service method: {method}")
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Cluster service call {method} failed: {e}")
+            self._reply(conn, call_id, 'error', f"{type(e).__name__}: {e}")
+        finally:
+            tasks.pop(call_id, None)
+
+    @staticmethod
+    def _reply(conn: Connection, call_id: int, kind: str, payload):
+        try:
+            conn.send((call_id, kind, payload))
+        except (OSError, ValueError):
+            # The worker went away; its reader thread cleans up
+            pass
+
+
+class ServiceClient:
+    """A worker's connection to the cluster service.
+
+    Calls are pipelined over one connection: requests are sent from the event
+    loop and a reader thread hands each reply to the waiting call by ID. A
+    lost connection fails the calls in flight and is reopened on the next call.
+    """
+
+    def __init__(self, address: Tuple[str, int], authkey: bytes, connect_timeout: float = 30):
+        self.address = tuple(address)
+        self.authkey = authkey
+        self.connect_timeout = connect_timeout
+        self._conn: Optional[Connection] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._pending: Dict[int, object] = {}
+        self._ids = itertools.count(1)
+
+    async def connect(self):
+        """Open the connection, retrying while the service starts up."""
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._conn is not None:
+                return
+            self._loop = asyncio.get_running_loop()
+            deadline = time.monotonic() + self.connect_timeout
+            while True:
+                try:
+                    conn = await asyncio.to_thread(Client, self.address, authkey=self.authkey)
+                    break
+                except ConnectionRefusedError:
+                    if time.monotonic() >= deadline:
+                        raise ConnectionError(f"Cluster service not reachable at {self.address}")
+                    await asyncio.sleep(0.5)
+            self._conn = conn
+            threading.Thread(target=self._read, args=(conn,), name='cluster-client', daemon=True).start()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _read(self, conn: Connection):
+        try:
+            while True:
+                message = conn.recv()
+                self._loop.call_soon_threadsafe(self._deliver, message)
+        except (EOFError, OSError):
+            pass
+        try:
+            self._loop.call_soon_threadsafe(self._disconnected, conn)
+        except RuntimeError:
+            # Event loop already closed during shutdown
+            pass
+
+    def _deliver(self, message):
+        call_id, kind, payload = message
+        waiter = self._pending.get(call_id)
+        if isinstance(waiter, asyncio.Queue):
+            waiter.put_nowait((kind, payload))
+        elif waiter is not None and not waiter.done():
+            if kind == 'result':
+                waiter.set_result(payload)
+            else:
+                waiter.set_exception(ServiceError(payload))
+
+    def _disconnected(self, conn: Connection):
+        if conn is not self._conn:
+            return
+        self._conn = None
+        print("Lost connection to the cluster service")
+        for waiter in self._pending.values():
+            if isinstance(waiter, asyncio.Queue):
+                waiter.put_nowait(('error', "connection to the cluster service lost"))
+            elif not waiter.done():
+                waiter.set_exception(ConnectionError("connection to the cluster service lost"))
+
+    async def _send(self, call_id: int, method: str, args, kwargs):
+        await self.connect()
+        try:
+            self._conn.send((call_id, method, args, kwargs))
+        except (OSError, ValueError) as e:
+            self._disconnected(self._conn)
+            raise ConnectionError(f"Cluster service call {method} failed: {e}") from e
+
+    async def call(self, method: str, *args, **kwargs):
+        """Run a service method and return its result."""
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[call_id] = future
+        try:
+            await self._send(call_id, method, args, kwargs)
+            return await future
+        finally:
+            self._pending.pop(call_id, None)
+
+    async def stream(self, method: str, *args, **kwargs) -> AsyncIterator:
+        """Iterate over the items of a streaming service method."""
+        call_id = next(self._ids)
+        queue = asyncio.Queue()
+        self._pending[call_id] = queue
+        finished = False
+        try:
+            await self._send(call_id, method, args, kwargs)
+            while True:
+                kind, payload = await queue.get()
+                if kind == 'item':
+                    yield payload
+                elif kind == 'end':
+                    finished = True
+                    return
+                else:
+                    finished = True
+                    raise ServiceError(payload)
+        finally:
+            self._pending.pop(call_id, None)
+            if not finished and self._conn is not None:
+                try:
+                    self._conn.send((call_id, CANCEL, (), {}))
+                except (OSError, ValueError):
+                    pass
+
+
+class RemoteYouTubeAPI:
+    """AsyncYouTubeMusicAPI stand-in for cluster workers; lookups run in the service."""
+
+    extract_playlist_id = YouTubeMusicAPI.extract_playlist_id
+    extract_video_id = YouTubeMusicAPI.extract_video_id
+
+    def __init__(self, service: ServiceClient):
+        self.service = service
+
+    async def start(self):
+        await self.service.connect()
+
+    async def close(self):
+        self.service.close()
+
+    def warm(self):
+        """The service warms its own clients."""
+
+    async def _call(self, default, method: str, *args, **kwargs):
+        # Like the local client, report lookup failures as "no results"
+        try:
+            return await self.service.call(method, *args, **kwargs)
+        except (ConnectionError, ServiceError) as e:
+            print(f"Cluster service {method} failed: {e}")
+            return default
+
+    async def search_song(self, query: str, max_results: int = 5) -> List[Dict]:
+        return await self._call([], 'search_song', query, max_results=max_results)
+
+    async def get_video_info(self, video_id: str) -> Optional[Dict]:
+        return await self._call(None, 'get_video_info', video_id)
+
+    async def get_related_songs(self, video_id: str, max_results: int = 5,
+                                title: str = None, artist: str = None, exclude=()) -> List[Dict]:
+        return await self._call([], 'get_related_songs', video_id, max_results=max_results,
+                                title=title, artist=artist, exclude=exclude)
+
+    async def iter_playlist(self, playlist_id: str) -> AsyncIterator[List[Dict]]:
+        async for page in self.service.stream('iter_playlist', playlist_id):
+            yield page
+
+
+class RemoteExtractor:
+    """ExtractorPool stand-in for cluster workers; streams resolve through the service's cache."""
+
+    queue_depth = 0
+
+    def __init__(self, service: ServiceClient):
+        self.service = service
+
+    async def extract_stream(self, url: str) -> Optional[StreamInfo]:
+        try:
+            return await self.service.call('get_stream', url)
+        except (ConnectionError, ServiceError) as e:
+            print(f"Stream extract via cluster service failed: {e}")
+            return None
+
+    async def invalidate(self, url: str):
+        """Drop the service's cached stream URL so the next get_stream extracts it again."""
+        try:
+            await self.service.call('invalidate_stream', url)
+        except (ConnectionError, ServiceError) as e:
+            print(f"Stream invalidate via cluster service failed: {e}")
+
+    async def warm(self):
+        """The service warms its own extractor pool."""
+
+    def shutdown(self):
+        pass
+
+
+def _service_main(address: Tuple[str, int], authkey: bytes):
+    try:
+        asyncio.run(ClusterService(address, authkey).serve())
+    except KeyboardInterrupt:
+        pass
+
+
+def _worker_main(index: int, shard_ids: List[int], shard_count: int,
+                 address: Tuple[str, int], authkey: bytes):
+    # Config is read when discord_bot builds the bot, so set this worker's share first
+    Config.SHARD_IDS = shard_ids
+    Config.SHARD_COUNT = shard_count
+    Config.CLUSTER_SERVICE = (address, authkey)
+    if Config.METRICS_PORT:
+        Config.METRICS_PORT += 1 + index
+    from discord_bot import bot
+    print(f"Cluster worker {index} running shards {shard_ids} of {shard_count}")
+    try:
+        bot.run(Config.DISCORD_TOKEN)
+    except KeyboardInterrupt:
+        pass
+
+
+def shard_assignment(workers: int, shard_count: int) -> List[List[int]]:
+    """Split shard IDs between workers round-robin."""
+    return [list(range(i, shard_count, workers)) for i in range(workers)]
+
+
+def run_cluster(workers: int = None, shard_count: int = None):
+    """Start the service and the worker processes, restarting any that exit."""
+    workers = workers or Config.CLUSTER_WORKERS
+    shard_count = shard_count or Config.SHARD_COUNT or workers
+    workers = min(workers, shard_count)
+    address = (Config.CLUSTER_SERVICE_HOST, Config.CLUSTER_SERVICE_PORT)
+    authkey = secrets.token_bytes(32)
+    # spawn keeps workers from inheriting this process's state (and works the same on every OS)
+    context = multiprocessing.get_context('spawn')
+
+    specs = {'service': (_service_main, (address, authkey))}
+    for index, shard_ids in enumerate(shard_assignment(workers, shard_count)):
+        specs[f'worker-{index}'] = (_worker_main, (index, shard_ids, shard_count, address, authkey))
+
+    processes: Dict[str, multiprocessing.Process] = {}
+    started: Dict[str, float] = {}
+
+    def start(name: str):
+        target, args = specs[name]
+        process = context.Process(target=target, args=args, name=f"musicbot-{name}")
+        process.start()
+        processes[name] = process
+        started[name] = time.monotonic()
+
+    print(f"Starting cluster: {workers} worker(s), {shard_count} shard(s)")
+    for name in specs:
+        start(name)
+    try:
+        while True:
+            time.sleep(1)
+            for name, process in processes.items():
+                if process.is_alive():
+                    continue
+                if time.monotonic() - started[name] < RESTART_DELAY:
+                    continue
+                print(f"Cluster process {name} exited with code {process.exitcode}; restarting")
+                start(name)
+    except KeyboardInterrupt:
+        print("Stopping cluster...")
+    finally:
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in processes.values():
+            process.join(timeout=10)
@@ -14,10 +14,133 @@ class Config:
     # Bot Settings
     MAX_QUEUE_SIZE = int(os.getenv('MAX_QUEUE_SIZE', 50))
     MAX_SONG_DURATION = int(os.getenv('MAX_SONG_DURATION', 600))
-    DEFAULT_VOLUME = float(os.getenv('DEFAULT_VOLUME', 0.5))
+    # Playback volume for tracks without a measured loudness gain (1.0 = unchanged, keeps Opus passthrough)
+    DEFAULT_VOLUME = float(os.getenv('DEFAULT_VOLUME', 1.0))
     # Optional: path to ffmpeg directory or to ffmpeg.exe (so yt-dlp and the bot can find ffmpeg/ffprobe)
     FFMPEG_LOCATION = os.getenv('FFMPEG_LOCATION', '').strip() or None
     
+    # Storage: per-guild queues, caches and other state live under DATA_DIR (each path can be overridden below)
+    DATA_DIR = os.getenv('DATA_DIR', 'data')
+    # Pre-multi-guild queue file, migrated into DISCORD_GUILD_ID's queue on first load
+    LEGACY_QUEUE_FILE = os.getenv('LEGACY_QUEUE_FILE', 'queue.json')
+    # Queue journal: batch writes for this many seconds, snapshot every N operations
+    QUEUE_FLUSH_DELAY = float(os.getenv('QUEUE_FLUSH_DELAY', 0.5))
+    QUEUE_COMPACT_OPS = int(os.getenv('QUEUE_COMPACT_OPS', 200))
+    
+    # HTTP client settings (YouTube Data API)
+    HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 10))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 100))
+    HTTP_MAX_PER_HOST = int(os.getenv('HTTP_MAX_PER_HOST', 10))
+    HTTP_KEEPALIVE = float(os.getenv('HTTP_KEEPALIVE', 30))
+    
+    # 'opus' streams Opus audio through ffmpeg without a PCM round trip; 'pcm' is the legacy path
+    PLAYBACK_MODE = os.getenv('PLAYBACK_MODE', 'opus').strip().lower()
+    
+    # Gapless transitions: open the next track this many seconds before the current one ends
+    PREOPEN_SECONDS = float(os.getenv('PREOPEN_SECONDS', 10))
+    PREBUFFER_FRAMES = int(os.getenv('PREBUFFER_FRAMES', 50))
+    # Fade out/in over this many seconds at track boundaries (0 = off; forces re-encoding)
+    CROSSFADE_SECONDS = float(os.getenv('CROSSFADE_SECONDS', 0))
+    # A stream that stops more than RESUME_MARGIN seconds before the track's end is re-resolved
+    # and restarted where it stopped, up to RESUME_ATTEMPTS times per track
+    RESUME_MARGIN = float(os.getenv('RESUME_MARGIN', 5))
+    RESUME_ATTEMPTS = int(os.getenv('RESUME_ATTEMPTS', 3))
+    
+    # Radio: refill in the background when fewer than RADIO_WATERMARK songs are queued,
+    # seeded from the last RADIO_SEED_COUNT played tracks
+    RADIO_WATERMARK = int(os.getenv('RADIO_WATERMARK', 2))
+    RADIO_SEED_COUNT = int(os.getenv('RADIO_SEED_COUNT', 3))
+    RADIO_DEDUP_SIZE = int(os.getenv('RADIO_DEDUP_SIZE', 500))
+    
+    # Related-track graph: radio neighbours per video, refreshed after RELATED_GRAPH_TTL seconds
+    RELATED_GRAPH_PATH = os.getenv('RELATED_GRAPH_PATH', os.path.join(DATA_DIR, 'related.db'))
+    RELATED_GRAPH_TTL = int(os.getenv('RELATED_GRAPH_TTL', 3 * 24 * 3600))
+    RELATED_GRAPH_SIZE = int(os.getenv('RELATED_GRAPH_SIZE', 20000))
+    RELATED_FANOUT = int(os.getenv('RELATED_FANOUT', 20))
+    
+    # Upstream resilience: a backend's circuit breaker opens after BREAKER_FAILURES consecutive
+    # failures and lets one trial call through every BREAKER_RESET seconds. ytmusicapi calls give
+    # up after YTMUSIC_TIMEOUT seconds. Searches and radio lookups start their secondary source once
+    # the primary has run longer than the HEDGE_PERCENTILE of its recent latencies, clamped to
+    # HEDGE_MIN_DELAY..HEDGE_MAX_DELAY seconds
+    BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 5))
+    BREAKER_RESET = float(os.getenv('BREAKER_RESET', 30))
+    YTMUSIC_TIMEOUT = float(os.getenv('YTMUSIC_TIMEOUT', 10))
+    HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 95))
+    HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 0.3))
+    HEDGE_MAX_DELAY = float(os.getenv('HEDGE_MAX_DELAY', 3.0))
+    
+    # yt-dlp extraction pool ('thread' or 'process' workers)
+    EXTRACTOR_POOL_SIZE = int(os.getenv('EXTRACTOR_POOL_SIZE', 2))
+    EXTRACTOR_POOL_MODE = os.getenv('EXTRACTOR_POOL_MODE', 'thread')
+    EXTRACT_TIMEOUT = float(os.getenv('EXTRACT_TIMEOUT', 30))
+    YTDL_CACHE_DIR = os.getenv('YTDL_CACHE_DIR', os.path.join(DATA_DIR, 'yt-dlp-cache'))
+    
+    # YouTube Data API quota (resets at midnight Pacific). Background traffic such as the
+    # radio fallback stops at QUOTA_BACKGROUND_RESERVE; searches below QUOTA_USER_RESERVE
+    # go through YouTube Music instead
+    QUOTA_DAILY_LIMIT = int(os.getenv('QUOTA_DAILY_LIMIT', 10000))
+    QUOTA_USER_RESERVE = int(os.getenv('QUOTA_USER_RESERVE', 500))
+    QUOTA_BACKGROUND_RESERVE = int(os.getenv('QUOTA_BACKGROUND_RESERVE', 3000))
+    QUOTA_STATE_PATH = os.getenv('QUOTA_STATE_PATH', os.path.join(DATA_DIR, 'quota.json'))
+    
+    # Local Opus cache for hot tracks; disabled while AUDIO_CACHE_SIZE_MB is 0. Tracks are
+    # cached after AUDIO_CACHE_MIN_PLAYS plays (counts expire after AUDIO_CACHE_PLAY_WINDOW seconds)
+    AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR', os.path.join(DATA_DIR, 'audio-cache'))
+    AUDIO_CACHE_SIZE_MB = int(os.getenv('AUDIO_CACHE_SIZE_MB', 0))
+    AUDIO_CACHE_MIN_PLAYS = int(os.getenv('AUDIO_CACHE_MIN_PLAYS', 3))
+    AUDIO_CACHE_PLAY_WINDOW = int(os.getenv('AUDIO_CACHE_PLAY_WINDOW', 30 * 24 * 3600))
+    AUDIO_CACHE_CONCURRENCY = int(os.getenv('AUDIO_CACHE_CONCURRENCY', 1))
+    
+    # Loudness normalisation towards LOUDNESS_TARGET LUFS (0 = off; -14 is a common choice). Each
+    # track is downloaded once more for measurement in the background, and any gain it needs
+    # re-encodes its playback to Opus; boosts are capped at LOUDNESS_MAX_GAIN dB
+    LOUDNESS_TARGET = float(os.getenv('LOUDNESS_TARGET', 0))
+    LOUDNESS_MAX_GAIN = float(os.getenv('LOUDNESS_MAX_GAIN', 10))
+    LOUDNESS_PATH = os.getenv('LOUDNESS_PATH', os.path.join(DATA_DIR, 'loudness.db'))
+    LOUDNESS_CONCURRENCY = int(os.getenv('LOUDNESS_CONCURRENCY', 1))
+    
+    # Background channel messages: at most one send/edit per MESSAGE_UPDATE_INTERVAL seconds
+    # per channel (pending edits merge). Now-playing buttons expire after NOW_PLAYING_TIMEOUT
+    # seconds without a track change or click
+    MESSAGE_UPDATE_INTERVAL = float(os.getenv('MESSAGE_UPDATE_INTERVAL', 1.0))
+    NOW_PLAYING_TIMEOUT = float(os.getenv('NOW_PLAYING_TIMEOUT', 300))
+    
+    # Cluster mode: CLUSTER_WORKERS bot processes, each running a share of SHARD_COUNT gateway
+    # shards (0 = one per worker), use one extraction/metadata service process listening on
+    # CLUSTER_SERVICE_HOST:CLUSTER_SERVICE_PORT. 0 workers runs everything in one process
+    CLUSTER_WORKERS = int(os.getenv('CLUSTER_WORKERS', 0))
+    SHARD_COUNT = int(os.getenv('SHARD_COUNT', 0))
+    CLUSTER_SERVICE_HOST = os.getenv('CLUSTER_SERVICE_HOST', '127.0.0.1')
+    CLUSTER_SERVICE_PORT = int(os.getenv('CLUSTER_SERVICE_PORT', 9120))
+    # Set by cluster.py inside worker processes: this worker's shards and the service (address, authkey)
+    SHARD_IDS = None
+    CLUSTER_SERVICE = None
+    
+    # Prometheus metrics endpoint (http://METRICS_HOST:METRICS_PORT/metrics); port 0 disables it
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+    
+    # Search result cache (in-memory LRU backed by SQLite)
+    SEARCH_CACHE_PATH = os.getenv('SEARCH_CACHE_PATH', os.path.join(DATA_DIR, 'search_cache.db'))
+    SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', 7 * 24 * 3600))
+    SEARCH_CACHE_MEMORY_SIZE = int(os.getenv('SEARCH_CACHE_MEMORY_SIZE', 1000))
+    SEARCH_CACHE_DISK_SIZE = int(os.getenv('SEARCH_CACHE_DISK_SIZE', 50000))
+    
+    # /play autocomplete: played tracks are kept in TRACK_INDEX_PATH; up to TRACK_INDEX_CACHED_SONGS
+    # more songs are indexed from the search cache at startup
+    TRACK_INDEX_PATH = os.getenv('TRACK_INDEX_PATH', os.path.join(DATA_DIR, 'tracks.db'))
+    TRACK_INDEX_CACHED_SONGS = int(os.getenv('TRACK_INDEX_CACHED_SONGS', 5000))
+    
+    # Stream URL prefetching
+    PREFETCH_COUNT = int(os.getenv('PREFETCH_COUNT', 2))
+    PREFETCH_CONCURRENCY = int(os.getenv('PREFETCH_CONCURRENCY', 2))
+    STREAM_CACHE_SIZE = int(os.getenv('STREAM_CACHE_SIZE', 256))
+    # Re-resolve stream URLs this many seconds before their googlevideo expiry
+    STREAM_EXPIRY_MARGIN = int(os.getenv('STREAM_EXPIRY_MARGIN', 600))
+    STREAM_DEFAULT_TTL = int(os.getenv('STREAM_DEFAULT_TTL', 3600))
+    
     @staticmethod
     def validate():
         """Validate that all required configuration is present"""
@@ -1,27 +1,33 @@
 import discord
+from discord import app_commands
 from discord.ext import commands
 import asyncio
-import json
+import math
 import os
 import random
-import yt_dlp
-from typing import Optional
+import threading
+import time
+from collections import deque
+from itertools import zip_longest
+from typing import Dict, List, Optional
+import metrics
+import startup
 from config import Config
-from youtube_api import YouTubeMusicAPI
-
-# YT-DLP options for extracting stream URL only (no download)
-YTDL_OPTS = {
-    'format': 'bestaudio/best',
-    'noplaylist': True,
-    'quiet': True,
-    'no_warnings': True,
-    'nocheckcertificate': True,
-    'http_headers': {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-        'Accept-Language': 'en-us,en;q=0.5',
-    },
-}
+from youtube_api import AsyncYouTubeMusicAPI
+from stream_cache import StreamPrefetcher
+from audio_cache import AudioCache
+from loudness import MIN_GAIN, LoudnessCache
+from cluster import RemoteExtractor, RemoteYouTubeAPI, ServiceClient
+from message_dispatch import ChannelDispatcher
+from extractor_pool import ExtractorPool, StreamInfo
+from queue_store import QueueJournal
+from track_queue import Track, TrackQueue
+from playback import GaplessSource, TrackSource
+from related_graph import RecentlyPlayedFilter
+from track_index import TrackIndex
+
+# Dispatcher key of each guild's now-playing message
+NOW_PLAYING = 'now_playing'
 
 def get_ffmpeg_path():
     ffmpeg_exe = 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg'
@@ -34,78 +40,94 @@ def get_ffmpeg_path():
         path = os.path.join(base, ffmpeg_exe)
     return (base, path) if os.path.isfile(path) else (None, None)
 
-def get_stream_url(url: str) -> Optional[str]:
-    """Extract direct audio stream URL using yt-dlp (no download)."""
-    try:
-        with yt_dlp.YoutubeDL(YTDL_OPTS) as ydl:
-            info = ydl.extract_info(url, download=False)
-        if not info:
-            return None
-        return info.get('url') or next(
-            (f.get('url') for f in reversed(info.get('formats') or []) if f.get('vcodec') == 'none' and f.get('url')),
-            None
-        )
-    except Exception as e:
-        print(f"Stream extract error: {e}")
-        return None
+class GuildPlayer:
+    """Queue, voice connection and radio settings for a single guild."""
 
-class MusicBot(commands.Bot):
-    def __init__(self):
-        intents = discord.Intents.default()
-        intents.message_content = True
-        intents.voice_states = True
-        super().__init__(command_prefix='!', intents=intents)
-
-        self.youtube_api = YouTubeMusicAPI()
+    def __init__(self, bot: 'MusicBot', guild_id: int):
+        self.bot = bot
+        self.guild_id = guild_id
         self.voice_client = None
-        self.current_song = None
-        self.queue = []
-        self.queue_file = "queue.json"
+        self.current_song: Optional[Track] = None
+        self.queue = TrackQueue()
+        self.queue_file = os.path.join(Config.DATA_DIR, 'queues', f'{guild_id}.json')
         self.radio_mode = False
         self.radio_related_count = 5
+        # Recently played tracks seed radio refills; recently_played keeps refills from repeating them
+        self.history = deque(maxlen=Config.RADIO_SEED_COUNT)
+        self.recently_played = RecentlyPlayedFilter()
+        self._radio_task: Optional[asyncio.Task] = None
+        self._import_task: Optional[asyncio.Task] = None
 
-        ffmpeg_dir, ffmpeg_path = get_ffmpeg_path()
-        self.ffmpeg_opts = {
-            'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-            'options': '-vn -f s16le -ar 48000 -ac 2',
-        }
-        if ffmpeg_path:
-            self.ffmpeg_opts['executable'] = ffmpeg_path
+        # The now-playing message is edited in place for each track; radio refills are noted in its footer
+        self.now_playing_view: Optional['MusicControlView'] = None
+        self._now_playing_dispatcher: Optional[ChannelDispatcher] = None
+        self._now_playing: Optional[tuple] = None
+        self._radio_notice: tuple = (None, None)
+
+        # Gapless playback: the live source, the pre-opened next track and recent transition gaps
+        self.source: Optional[GaplessSource] = None
+        self._preopened: Optional[TrackSource] = None
+        # The queue head a pre-open was last tried for, so a failed attempt is not retried every
+        # second; cleared whenever the pre-opened source is consumed or dropped
+        self._preopen_attempt: Optional[Track] = None
+        self._watch_task: Optional[asyncio.Task] = None
+        self.transition_gaps = deque(maxlen=100)
+        # Restarts of the current track after its stream dropped
+        self._resume_attempts = 0
+
+        self.journal = QueueJournal(self.queue_file, self.queue.to_dicts)
 
         self.load_queue()
     
     def load_queue(self):
-        """Load queue from JSON file"""
+        """Restore the queue from its snapshot and journal"""
+        # Single-guild installs kept their queue in queue.json; pick it up once
+        legacy = Config.LEGACY_QUEUE_FILE if self.guild_id == Config.DISCORD_GUILD_ID else None
         try:
-            if os.path.exists(self.queue_file):
-                with open(self.queue_file, 'r', encoding='utf-8') as f:
-                    self.queue = json.load(f)
-                print(f"Loaded {len(self.queue)} songs from queue file")
+            self.queue.clear()
+            self.queue.extend(Track.from_dict(s) for s in self.journal.load(fallback_path=legacy))
+            if self.queue:
+                print(f"Loaded {len(self.queue)} songs from queue file for guild {self.guild_id}")
         except Exception as e:
             print(f"Error loading queue: {e}")
-            self.queue = []
+            self.queue.clear()
     
-    def save_queue(self):
-        """Save queue to JSON file"""
-        try:
-            with open(self.queue_file, 'w', encoding='utf-8') as f:
-                json.dump(self.queue, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Error saving queue: {e}")
+    def enqueue(self, *tracks: Track):
+        """Add tracks to the end of the queue"""
+        self.queue.extend(tracks)
+        self.journal.record('append', songs=[t.to_dict() for t in tracks])
     
-    async def on_ready(self):
-        print(f'{self.user} has connected to Discord!')
-        print(f'Bot is in {len(self.guilds)} guilds')
+    def pop_next(self) -> Track:
+        """Remove and return the track at the head of the queue"""
+        track = self.queue.popleft()
+        self.journal.record('pop', index=0)
+        return track
     
-    async def on_voice_state_update(self, member, before, after):
-        """Handle voice state updates (user leaves/joins voice channel)"""
-        if member == self.user:
-            return
-        
-        # If bot is alone in voice channel, disconnect
-        if self.voice_client and len(self.voice_client.channel.members) == 1:
-            await self.voice_client.disconnect()
-            self.voice_client = None
+    def remove_at(self, index: int) -> Track:
+        """Remove and return the track at a 0-based position"""
+        track = self.queue.remove_at(index)
+        self.journal.record('pop', index=index)
+        self._check_preopened()
+        return track
+    
+    def move(self, from_index: int, to_index: int) -> Track:
+        """Move a track between 0-based positions and return it"""
+        track = self.queue.move(from_index, to_index)
+        self.journal.record('move', **{'from': from_index, 'to': to_index})
+        self._check_preopened()
+        return track
+    
+    def shuffle(self):
+        order = list(range(len(self.queue)))
+        random.shuffle(order)
+        self.queue.reorder(order)
+        self.journal.record('reorder', order=order)
+        self._check_preopened()
+    
+    def clear(self):
+        self.queue.clear()
+        self.journal.record('clear')
+        self._check_preopened()
     
     async def join_voice_channel(self, ctx):
         """Join the voice channel of the user who sent the command"""
@@ -125,277 +147,944 @@ class MusicBot(commands.Bot):
         
         return True
 
-    def _after_playing(self, ctx):
+    async def disconnect(self):
+        if self.voice_client:
+            await self.voice_client.disconnect()
+            self.voice_client = None
+
+    def stop(self):
+        """Stop playback and clear the queue."""
+        if self.voice_client:
+            self.voice_client.stop()
+        for task in (self._radio_task, self._import_task):
+            if task and not task.done():
+                task.cancel()
+        self.clear()
+        self.current_song = None
+        self.retire_now_playing()
+
+    def start_playlist_import(self, ctx, playlist_id: str, status: discord.Message) -> bool:
+        """Import a playlist in the background; False if an import is already running."""
+        if self._import_task is not None and not self._import_task.done():
+            return False
+        self._import_task = self.bot.loop.create_task(self._import_playlist(ctx, playlist_id, status))
+        return True
+
+    async def _import_playlist(self, ctx, playlist_id: str, status: discord.Message):
+        """Stream a playlist into the queue page by page, starting playback after the first page."""
+        requested_at = time.perf_counter()
+        messages = self.bot.get_dispatcher(ctx.channel)
+        added = too_long = unknown = over_limit = 0
+        started = False
+        try:
+            async for page in self.bot.youtube_api.iter_playlist(playlist_id):
+                tracks = []
+                for song in page:
+                    if song['duration'] is None:
+                        unknown += 1
+                    elif song['duration'] > Config.MAX_SONG_DURATION:
+                        too_long += 1
+                    elif len(self.queue) + len(tracks) >= Config.MAX_QUEUE_SIZE:
+                        over_limit += 1
+                    else:
+                        tracks.append(Track.from_dict(song, requested_by=ctx.author.display_name))
+                if tracks:
+                    self.enqueue(*tracks)
+                    added += len(tracks)
+                if not started and self.queue and self.voice_client:
+                    started = True
+                    if not self.voice_client.is_playing() and self.source is None:
+                        self.bot.loop.create_task(self.play_next_song(ctx, requested_at=requested_at))
+                    else:
+                        self.prefetch_upcoming()
+                if over_limit:
+                    break
+                messages.edit(status, content=f"📃 Importing playlist... {added} song(s) queued so far")
+        except Exception as e:
+            print(f"Error importing playlist {playlist_id}: {e}")
+            messages.edit(status, content=f"❌ Playlist import failed after {added} song(s): {e}")
+            return
+
+        notes = []
+        if too_long:
+            notes.append(f"{too_long} longer than {Config.MAX_SONG_DURATION//60} minutes")
+        if unknown:
+            notes.append(f"{unknown} of unknown length")
+        if over_limit:
+            notes.append(f"stopped at the {Config.MAX_QUEUE_SIZE}-song queue limit")
+        summary = f"✅ Added {added} song(s) from the playlist."
+        if notes:
+            summary += f" (Skipped: {'; '.join(notes)})"
+        messages.edit(status, content=summary)
+
+    def prefetch_upcoming(self):
+        """Warm stream URLs (and measure loudness) for the next few queued songs in the background."""
+        upcoming = self.queue.peek(Config.PREFETCH_COUNT)
+        self.bot.loop.create_task(self._prefetch_streams(upcoming))
+        for track in upcoming:
+            self.bot.loudness.schedule(track)
+
+    async def _prefetch_streams(self, tracks: List[Track]):
+        # Tracks served from the audio cache need no stream URL
+        self.bot.prefetcher.prefetch([t.url for t in tracks if await self.bot.audio_cache.lookup(t.id) is None])
+
+    def maybe_refill_radio(self, ctx):
+        """Start a background radio refill when the queue drops below the watermark."""
+        if self.radio_mode and self.history and len(self.queue) < Config.RADIO_WATERMARK:
+            self._radio_refill_task(ctx)
+
+    async def refill_radio(self, ctx) -> int:
+        """Wait for a radio refill (joining one already running); returns songs added."""
+        return await asyncio.shield(self._radio_refill_task(ctx))
+
+    def _radio_refill_task(self, ctx) -> asyncio.Task:
+        if self._radio_task is None or self._radio_task.done():
+            self._radio_task = self.bot.loop.create_task(self._refill_radio(ctx))
+        return self._radio_task
+
+    async def _refill_radio(self, ctx) -> int:
+        with metrics.RADIO_REFILL_TIME.time():
+            picked = await self._pick_radio_tracks()
+        if not picked or not self.radio_mode:
+            return 0
+        self.enqueue(*picked)
+        self.prefetch_upcoming()
+        self._radio_notice = (self.current_song, f"📻 Radio added {len(picked)} similar song(s) to the queue")
+        if self._now_playing is not None and self._now_playing[0] is self.current_song:
+            self.show_now_playing(ctx, *self._now_playing)
+        return len(picked)
+
+    async def _pick_radio_tracks(self) -> List[Track]:
+        # Most recent first, so the current song's neighbours lead the interleave
+        seeds = list(reversed(self.history))
+        results = await asyncio.gather(*(
+            self.bot.youtube_api.get_related_songs(
+                t.id, max_results=self.radio_related_count, title=t.title, artist=t.artist,
+                exclude=self.recently_played,
+            )
+            for t in seeds
+        ), return_exceptions=True)
+
+        seen = {t.id for t in self.queue}
+        picked = []
+        for group in zip_longest(*(r for r in results if isinstance(r, list))):
+            for song in group:
+                if song and song['id'] not in seen:
+                    seen.add(song['id'])
+                    picked.append(Track.from_dict(song, requested_by="📻 Radio"))
+        return picked[:self.radio_related_count]
+
+    def _check_preopened(self):
+        """Drop the pre-opened source if it is no longer the next track in the queue."""
+        if self._preopened is None:
+            return
+        if self.queue and self.queue[0] is self._preopened.track:
+            return
+        if self.source is not None:
+            self.source.take_next()
+        stale, self._preopened = self._preopened, None
+        self._preopen_attempt = None
+        threading.Thread(target=stale.cleanup, daemon=True).start()
+
+    def _record_gap(self, ended_at: Optional[float], source: TrackSource):
+        if ended_at is None or source.first_read_at is None:
+            return
+        gap = source.first_read_at - ended_at
+        self.transition_gaps.append(gap)
+        print(f"Transition gap in guild {self.guild_id}: {gap * 1000:.1f} ms")
+
+    def _track_started(self, source: TrackSource, ended_at: Optional[float], requested_at: Optional[float]):
+        self._record_gap(ended_at, source)
+        if requested_at is not None:
+            metrics.TIME_TO_FIRST_AUDIO.observe(source.first_read_at - requested_at)
+
+    def _open_track(self, track: Track, stream, ended_at: float = None,
+                    requested_at: float = None) -> TrackSource:
+        """Create the audio source for a track; its gap and startup time are recorded on the first frame."""
+        return TrackSource(
+            track,
+            self.bot.create_audio_source(stream, track),
+            on_start=lambda src: self._track_started(src, ended_at, requested_at),
+        )
+
+    def _set_current(self, ctx, track: Track):
+        """Mark a track as now playing and top up the radio queue if it is running low."""
+        self.current_song = track
+        self._resume_attempts = 0
+        self.history.append(track)
+        self.recently_played.add(track.id)
+        self.bot.loop.create_task(self.bot.audio_cache.record_play(track.id, track.url))
+        self.bot.loop.create_task(self.bot.track_index.record_play(track.to_dict()))
+        self.bot.loudness.schedule(track)
+        self.maybe_refill_radio(ctx)
+
+    def _start_playback(self, ctx, source: TrackSource, resumed: bool = False):
+        self.source = GaplessSource(
+            source,
+            on_transition=lambda src, ended_at: self.bot.loop.call_soon_threadsafe(
+                self._on_gapless_transition, ctx, src, ended_at
+            ),
+        )
+        if not resumed:
+            self._set_current(ctx, source.track)
+        self.voice_client.play(self.source, after=lambda e: self._after_playing(ctx, e))
+        self.prefetch_upcoming()
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = self.bot.loop.create_task(self._watch_playback())
+
+    async def _watch_playback(self):
+        """Pre-open the next track shortly before the current one ends."""
+        while self.source is not None:
+            await asyncio.sleep(1)
+            source = self.source
+            if source is None or source.next is not None or self._preopened is not None:
+                continue
+            current = source.current
+            if not current.track.duration or not self.queue or self.queue[0] is self._preopen_attempt:
+                continue
+            if current.track.duration - current.position <= Config.PREOPEN_SECONDS:
+                await self._preopen_next()
+
+    async def _preopen_next(self):
+        track = self.queue[0]
+        self._preopen_attempt = track
+        source = None
+        try:
+            stream = await self.bot.get_stream(track)
+            if not stream:
+                return
+            source = TrackSource(track, self.bot.create_audio_source(stream, track))
+            await asyncio.to_thread(source.prime, Config.PREBUFFER_FRAMES)
+        except Exception as e:
+            print(f"Error pre-opening next track: {e}")
+            if source is not None:
+                await asyncio.to_thread(source.cleanup)
+            return
+        if self.source is None or not self.queue or self.queue[0] is not track:
+            await asyncio.to_thread(source.cleanup)
+            return
+        self._preopened = source
+        self.source.set_next(source)
+
+    def _on_gapless_transition(self, ctx, source: TrackSource, ended_at: float):
+        """The live source switched to the pre-opened track (runs on the event loop)."""
+        self._preopened = None
+        self._preopen_attempt = None
+        self._record_gap(ended_at, source)
+        if self.queue and self.queue[0] is source.track:
+            self.pop_next()
+        self._set_current(ctx, source.track)
+        self.prefetch_upcoming()
+        self.show_now_playing(ctx, source.track)
+
+    def _after_playing(self, ctx, error: Exception = None):
         """Called when playback finishes: play next song."""
-        asyncio.run_coroutine_threadsafe(self.play_next_song(ctx), self.loop)
+        ended_at = time.perf_counter()
+        if error is not None:
+            metrics.FFMPEG_FAILURES.inc()
+            print(f"Playback error in guild {self.guild_id}: {error}")
+        ended = self.source.current if self.source else None
+        # Claim the pre-opened source before the audio thread cleans the old one up
+        upcoming = self.source.take_next() if self.source else None
+        self.bot.loop.call_soon_threadsafe(self._playback_finished, ctx, ended, upcoming, ended_at)
+
+    def _playback_finished(self, ctx, ended: Optional[TrackSource], upcoming: Optional[TrackSource],
+                           ended_at: float):
+        self.source = None
+        self._preopened = None
+        # A resumed track or a fresh play_next_song may pre-open the queue head again
+        self._preopen_attempt = None
+        if (ended is not None and ended.ended_early and self.voice_client
+                and self._resume_attempts < Config.RESUME_ATTEMPTS):
+            # The stream dropped mid-track: reopen it where it stopped; the next track is opened again later
+            if upcoming is not None:
+                threading.Thread(target=upcoming.cleanup, daemon=True).start()
+            self._resume_attempts += 1
+            self.bot.loop.create_task(self._resume(ctx, ended.track, ended.position))
+            return
+        if upcoming is not None:
+            if self.voice_client and self.queue and self.queue[0] is upcoming.track:
+                # Skipped while the next track was already pre-opened: hand over the warm source
+                self.pop_next()
+                upcoming.on_start = lambda src: self._record_gap(ended_at, src)
+                self._start_playback(ctx, upcoming)
+                self.show_now_playing(ctx, upcoming.track)
+                return
+            threading.Thread(target=upcoming.cleanup, daemon=True).start()
+        if self.voice_client is None:
+            return
+        self.bot.loop.create_task(self.play_next_song(ctx, ended_at=ended_at))
+
+    async def _open_at(self, track: Track, position: float, refresh: bool = False) -> Optional[TrackSource]:
+        """Open a track starting `position` seconds in; `refresh` re-resolves its stream URL first."""
+        if refresh:
+            await self.bot.invalidate_stream(track.url)
+        stream = await self.bot.get_stream(track)
+        if not stream:
+            return None
+        return TrackSource(track, self.bot.create_audio_source(stream, track, start=position),
+                           start_offset=position)
+
+    async def _resume(self, ctx, track: Track, position: float):
+        """Restart a track whose stream ended early, from where it stopped."""
+        print(f"Stream for {track.id} ended at {position:.1f}s of {track.duration}s in guild {self.guild_id}; "
+              f"resuming (attempt {self._resume_attempts}/{Config.RESUME_ATTEMPTS})")
+        try:
+            # The cached URL has most likely expired, so resolve a fresh one
+            source = await self._open_at(track, position, refresh=True)
+        except Exception as e:
+            print(f"Error resuming {track.id}: {e}")
+            source = None
+        if self.voice_client is None or self.source is not None or self.current_song is not track:
+            # Disconnected, stopped or replaced while the stream was re-resolved
+            if source is not None:
+                threading.Thread(target=source.cleanup, daemon=True).start()
+            return
+        if source is None:
+            await self.play_next_song(ctx)
+            return
+        metrics.PLAYBACK_RESTARTS.inc(reason='resume')
+        self._start_playback(ctx, source, resumed=True)
+
+    async def seek(self, position: float) -> bool:
+        """Restart the current track at `position` seconds; False if nothing is playing."""
+        if self.source is None:
+            return False
+        track = self.source.current.track
+        source = await self._open_at(track, position)
+        if source is None:
+            return False
+        try:
+            await asyncio.to_thread(source.prime, Config.PREBUFFER_FRAMES)
+            if self.source is None or self.source.current.track is not track:
+                await asyncio.to_thread(source.cleanup)
+                return False
+            metrics.PLAYBACK_RESTARTS.inc(reason='seek')
+            self.source.replace(source)
+        except Exception as e:
+            print(f"Error seeking in {track.id}: {e}")
+            # Don't leave the new ffmpeg process running
+            await asyncio.to_thread(source.cleanup)
+            return False
+        return True
+
+    def show_now_playing(self, ctx, track: Track, title: str = "🎵 Now Playing", repost: bool = False):
+        """Show a track on the guild's now-playing message, editing it in place.
+
+        A new message is posted on first use, when the command channel changes and on `repost`.
+        """
+        dispatcher = self.bot.get_dispatcher(ctx.channel)
+        if repost or dispatcher is not self._now_playing_dispatcher:
+            self.retire_now_playing()
+            self._now_playing_dispatcher = dispatcher
+        view = self.now_playing_view
+        if view is None or view.is_finished():
+            view = self.now_playing_view = MusicControlView(self)
+        else:
+            # Restarts the view's idle timeout
+            view.timeout = Config.NOW_PLAYING_TIMEOUT
+        self._now_playing = (track, title)
+
+        embed = now_playing_embed(track, title)
+        notice_track, notice = self._radio_notice
+        if notice and notice_track is track:
+            embed.set_footer(text=notice)
+        dispatcher.update(NOW_PLAYING, content=None, embed=embed, view=view)
+
+    def retire_now_playing(self):
+        """Disable the now-playing buttons and stop editing that message."""
+        view, self.now_playing_view = self.now_playing_view, None
+        dispatcher, self._now_playing_dispatcher = self._now_playing_dispatcher, None
+        self._now_playing = None
+        if view is not None:
+            view.stop()
+            view.disable_all_items()
+        if dispatcher is not None:
+            dispatcher.release(NOW_PLAYING, view=view)
+
+    def expire_controls(self, view: 'MusicControlView'):
+        """Grey out idle now-playing buttons; the next track brings up a fresh set."""
+        if view is self.now_playing_view and self._now_playing_dispatcher is not None:
+            view.disable_all_items()
+            self._now_playing_dispatcher.update(NOW_PLAYING, view=view)
+
+    async def play_next_song(self, ctx, ended_at: float = None, requested_at: float = None):
+        """Play the next song in the queue (streaming, no download).
 
-    async def play_next_song(self, ctx):
-        """Play the next song in the queue (streaming, no download)."""
+        `requested_at` is the perf_counter time of the !play that started playback.
+        """
+        messages = self.bot.get_dispatcher(ctx.channel)
         if not self.queue:
             if self.radio_mode and self.current_song:
-                related = await asyncio.to_thread(
-                    self.youtube_api.get_related_songs,
-                    self.current_song['id'],
-                    max_results=self.radio_related_count,
-                    title=self.current_song.get('title'),
-                    artist=self.current_song.get('artist'),
-                )
-                if related:
-                    for s in related:
-                        s['requested_by'] = "📻 Radio"
-                        self.queue.append(s)
-                    self.save_queue()
-                    await ctx.send(f"📻 **Radio:** Added {len(related)} similar song(s) to the queue.")
-                else:
-                    await ctx.send("Queue is empty! (Radio couldn't find more similar songs)")
+                # Normally the background refill has already topped the queue up
+                if not await self.refill_radio(ctx):
+                    self.retire_now_playing()
+                    messages.post(content="Queue is empty! (Radio couldn't find more similar songs)")
                     return
             else:
-                await ctx.send("Queue is empty!")
+                self.retire_now_playing()
+                messages.post(content="Queue is empty!")
                 return
 
-        song_data = self.queue.pop(0)
+        song_data = self.pop_next()
         self.current_song = song_data
-        self.save_queue()
 
         try:
-            loading_msg = await ctx.send("⏳ Loading...")
-            stream_url = await asyncio.to_thread(get_stream_url, song_data['url'])
-            if not stream_url:
-                await loading_msg.edit(content="Failed to load audio. Skipping.")
-                await self.play_next_song(ctx)
+            # Usually merged with the Now Playing edit below when the stream is already warm
+            self.show_now_playing(ctx, song_data, title="⏳ Loading...")
+            stream = await self.bot.get_stream(song_data)
+            if not stream:
+                messages.post(content=f"Failed to load audio for **{song_data.title}**. Skipping.")
+                await self.play_next_song(ctx, ended_at=ended_at, requested_at=requested_at)
                 return
 
-            source = discord.FFmpegPCMAudio(stream_url, **self.ffmpeg_opts)
+            try:
+                source = self._open_track(song_data, stream, ended_at, requested_at)
+            except Exception:
+                metrics.FFMPEG_FAILURES.inc()
+                raise
 
             if self.voice_client:
-                self.voice_client.play(
-                    source,
-                    after=lambda e: self._after_playing(ctx),
-                )
-
-                embed = discord.Embed(
-                    title="🎵 Now Playing",
-                    description=f"**{song_data['title']}**\nby {song_data['artist']}",
-                    color=0x00ff00
-                )
-                embed.set_thumbnail(url=song_data['thumbnail'])
-                embed.add_field(name="Duration", value=f"{song_data['duration']//60}:{song_data['duration']%60:02d}")
-                embed.add_field(name="Requested by", value=song_data['requested_by'])
-
-                view = MusicControlView()
-                await loading_msg.edit(content=None, embed=embed, view=view)
-                message = loading_msg
-
-                await asyncio.sleep(30)
-                view.disable_all_items()
-                await message.edit(view=view)
+                self._start_playback(ctx, source)
+                self.show_now_playing(ctx, song_data)
 
         except Exception as e:
             print(f"Error playing song: {e}")
-            await ctx.send(f"Error playing song: {str(e)}")
-            await self.play_next_song(ctx)
+            messages.post(content=f"Error playing song: {str(e)}")
+            await self.play_next_song(ctx, ended_at=ended_at, requested_at=requested_at)
+
+class MusicBot(commands.AutoShardedBot):
+    def __init__(self):
+        intents = discord.Intents.default()
+        intents.message_content = True
+        intents.voice_states = True
+        # Cluster workers run only their own shards; otherwise discord.py picks the shard count
+        super().__init__(command_prefix='!', intents=intents,
+                         shard_ids=Config.SHARD_IDS, shard_count=Config.SHARD_COUNT or None)
+
+        if Config.CLUSTER_SERVICE is not None:
+            # Cluster worker: lookups and extraction happen in the shared service process
+            service = ServiceClient(*Config.CLUSTER_SERVICE)
+            self.youtube_api = RemoteYouTubeAPI(service)
+            self.extractor_pool = RemoteExtractor(service)
+        else:
+            self.youtube_api = AsyncYouTubeMusicAPI()
+            self.extractor_pool = ExtractorPool()
+            metrics.EXTRACT_QUEUE_DEPTH.set_function(lambda: self.extractor_pool.queue_depth)
+            metrics.QUOTA_REMAINING.set_function(lambda: self.youtube_api.quota.remaining)
+        self.players: Dict[int, GuildPlayer] = {}
+        self.dispatchers: Dict[int, ChannelDispatcher] = {}
+        self.prefetcher = StreamPrefetcher(self.extractor_pool.extract_stream)
+        self.metrics_runner = None
+        self._warm_task: Optional[asyncio.Task] = None
+        metrics.VOICE_SESSIONS.set_function(
+            lambda: sum(1 for p in self.players.values() if p.voice_client is not None)
+        )
+
+        ffmpeg_dir, ffmpeg_path = get_ffmpeg_path()
+        self.ffmpeg_opts = {
+            'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
+            # FFmpegOpusAudio adds its own Opus output arguments
+            'options': '-vn' if Config.PLAYBACK_MODE == 'opus' else '-vn -f s16le -ar 48000 -ac 2',
+        }
+        if ffmpeg_path:
+            self.ffmpeg_opts['executable'] = ffmpeg_path
+        self.audio_cache = AudioCache(self.prefetcher.get_stream, ffmpeg=ffmpeg_path or 'ffmpeg')
+        self.track_index = TrackIndex()
+        self.loudness = LoudnessCache(self.get_stream, ffmpeg=ffmpeg_path or 'ffmpeg')
+    
+    def audio_filters(self, track: Optional[Track], start: float = 0.0) -> List[str]:
+        """ffmpeg audio filters to apply to a track (empty for untouched playback).
+
+        `start` is where playback begins in the track; filter timestamps count from there.
+        """
+        filters = []
+        volume = Config.DEFAULT_VOLUME
+        if track is not None and self.loudness.enabled:
+            gain = self.loudness.gain(track.id)
+            metrics.record_cache('loudness', gain is not None)
+            if gain is not None:
+                # A measured gain replaces the fixed volume
+                volume = 10 ** (gain / 20)
+        if volume <= 0 or abs(20 * math.log10(volume)) >= MIN_GAIN:
+            # Scaled by ffmpeg rather than per frame in Python; any filter means re-encoding to Opus
+            filters.append(f"volume={volume:.3f}")
+        fade = Config.CROSSFADE_SECONDS
+        if fade > 0 and track is not None and track.duration and track.duration > 2 * fade:
+            if not start:
+                filters.append(f"afade=t=in:d={fade}")
+            fade_at = track.duration - fade - start
+            if fade_at > 0:
+                filters.append(f"afade=t=out:st={fade_at}:d={fade}")
+        return filters
+
+    async def get_stream(self, track: Track) -> Optional[StreamInfo]:
+        """Resolve a track's audio: the local cache when it has a copy, else the stream prefetcher."""
+        if self.loudness.enabled:
+            # Ready the stored gain so audio_filters never reads SQLite on the event loop
+            await self.loudness.load(track.id)
+        if self.audio_cache.enabled:
+            stream = await self.audio_cache.lookup(track.id)
+            metrics.record_cache('audio', stream is not None)
+            if stream is not None:
+                return stream
+        return await self.prefetcher.get_stream(track.url)
+
+    async def invalidate_stream(self, url: str):
+        """Forget a cached stream URL (e.g. one that expired mid-track) so it is resolved again."""
+        self.prefetcher.invalidate(url)
+        if isinstance(self.extractor_pool, RemoteExtractor):
+            # Cluster workers resolve through the service's cache, which would return the same URL
+            await self.extractor_pool.invalidate(url)
+
+    def create_audio_source(self, stream: StreamInfo, track: Track = None,
+                            start: float = 0.0) -> discord.AudioSource:
+        """Open an ffmpeg audio source for a resolved stream, `start` seconds in.
+
+        In opus mode, Opus streams are copied straight through to Discord; other
+        codecs, and any track that needs audio filters, are encoded to Opus by
+        ffmpeg. PCM mode decodes to raw audio and leaves Opus encoding to discord.py.
+        """
+        opts = dict(self.ffmpeg_opts)
+        before_options = opts.pop('before_options', '')
+        if stream.is_local:
+            # The reconnect flags only apply to network inputs
+            before_options = ''
+        if start:
+            # Input seeking: ffmpeg requests the stream from that point instead of reading up to it
+            before_options = f"{before_options} -ss {start:.2f}".strip()
+        if before_options:
+            opts['before_options'] = before_options
+        filters = self.audio_filters(track, start)
+        if filters:
+            opts['options'] = f"{opts['options']} -af {','.join(filters)}"
+        if Config.PLAYBACK_MODE == 'opus':
+            # codec='opus' makes discord.py use '-c:a copy' instead of re-encoding
+            codec = 'opus' if stream.is_opus and not filters else None
+            return discord.FFmpegOpusAudio(stream.url, codec=codec, **opts)
+        return discord.FFmpegPCMAudio(stream.url, **opts)
+    
+    def get_player(self, guild: discord.abc.Snowflake) -> GuildPlayer:
+        """Return the player for a guild, creating it on first use."""
+        player = self.players.get(guild.id)
+        if player is None:
+            player = GuildPlayer(self, guild.id)
+            self.players[guild.id] = player
+        return player
+    
+    def get_dispatcher(self, channel: discord.abc.Messageable) -> ChannelDispatcher:
+        """Return the message dispatcher for a channel, creating it on first use."""
+        dispatcher = self.dispatchers.get(channel.id)
+        if dispatcher is None:
+            dispatcher = ChannelDispatcher(channel)
+            self.dispatchers[channel.id] = dispatcher
+        return dispatcher
+    
+    async def setup_hook(self):
+        startup.timer.mark('logged in')
+        with startup.timer.phase('setup_hook'):
+            await self.youtube_api.start()
+            self.metrics_runner = await metrics.start_server()
+
+    async def _warm_up(self):
+        """Load the slow clients in the background once the bot is online."""
+        async def timed(name: str, step):
+            with startup.timer.phase(name):
+                try:
+                    await step
+                except Exception as e:
+                    print(f"Warm-up step '{name}' failed: {e}")
+
+        await asyncio.gather(
+            timed('warm ytmusic', asyncio.to_thread(self.youtube_api.warm)),
+            timed('warm extractors', self.extractor_pool.warm()),
+            timed('index tracks', asyncio.to_thread(self._load_track_index)),
+        )
+        print(startup.timer.report())
+
+    def _load_track_index(self):
+        # Cluster workers have no search cache of their own; they index played tracks only
+        search_cache = getattr(self.youtube_api, 'search_cache', None)
+        cached = search_cache.songs(Config.TRACK_INDEX_CACHED_SONGS) if search_cache else ()
+        self.track_index.load(cached)
+        print(f"Indexed {len(self.track_index)} tracks for /play suggestions")
+    
+    async def close(self):
+        for player in self.players.values():
+            await player.journal.compact()
+        await self.youtube_api.close()
+        self.audio_cache.close()
+        self.track_index.close()
+        self.loudness.close()
+        self.extractor_pool.shutdown()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        await super().close()
+    
+    async def bot_check(self, ctx):
+        # Music commands act on a guild's player, so they cannot run in DMs
+        return ctx.guild is not None
+    
+    async def on_ready(self):
+        print(f'{self.user} has connected to Discord!')
+        print(f'Bot is in {len(self.guilds)} guilds')
+        # on_ready fires again after reconnects; warm up only once
+        if self._warm_task is None:
+            startup.timer.mark('gateway ready')
+            self._warm_task = asyncio.create_task(self._warm_up())
+    
+    async def on_voice_state_update(self, member, before, after):
+        """Handle voice state updates (user leaves/joins voice channel)"""
+        player = self.players.get(member.guild.id)
+        if player is None:
+            return
+        
+        if member == self.user:
+            # Bot was disconnected or kicked from voice
+            if after.channel is None:
+                player.voice_client = None
+            return
+        
+        # If bot is alone in voice channel, disconnect
+        if player.voice_client and len(player.voice_client.channel.members) == 1:
+            await player.disconnect()
 
 # Create bot instance
 bot = MusicBot()
 
+def now_playing_embed(track: Track, title: str = "🎵 Now Playing") -> discord.Embed:
+    embed = discord.Embed(
+        title=title,
+        description=f"**{track.title}**\nby {track.artist}",
+        color=0x00ff00
+    )
+    embed.set_thumbnail(url=track.thumbnail)
+    embed.add_field(name="Duration", value=track.duration_text)
+    embed.add_field(name="Requested by", value=track.requested_by)
+    return embed
+
 class MusicControlView(discord.ui.View):
-    def __init__(self):
-        super().__init__(timeout=30)
+    def __init__(self, player: GuildPlayer):
+        super().__init__(timeout=Config.NOW_PLAYING_TIMEOUT)
+        self.player = player
 
     def disable_all_items(self):
         """Disable all buttons in this view."""
         for item in self.children:
             item.disabled = True
 
+    async def on_timeout(self):
+        self.player.expire_controls(self)
+
     @discord.ui.button(label="⏸️ Pause", style=discord.ButtonStyle.secondary)
     async def pause_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if bot.voice_client and bot.voice_client.is_playing():
-            bot.voice_client.pause()
+        if self.player.voice_client and self.player.voice_client.is_playing():
+            self.player.voice_client.pause()
             await interaction.response.send_message("⏸️ Paused!", ephemeral=True)
         else:
             await interaction.response.send_message("Nothing is currently playing!", ephemeral=True)
     
     @discord.ui.button(label="▶️ Resume", style=discord.ButtonStyle.secondary)
     async def resume_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if bot.voice_client and bot.voice_client.is_paused():
-            bot.voice_client.resume()
+        if self.player.voice_client and self.player.voice_client.is_paused():
+            self.player.voice_client.resume()
             await interaction.response.send_message("▶️ Resumed!", ephemeral=True)
         else:
             await interaction.response.send_message("Nothing is paused!", ephemeral=True)
     
     @discord.ui.button(label="⏭️ Skip", style=discord.ButtonStyle.primary)
     async def skip_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if bot.voice_client and bot.voice_client.is_playing():
-            bot.voice_client.stop()
+        if self.player.voice_client and self.player.voice_client.is_playing():
+            self.player.voice_client.stop()
+            metrics.SKIPS.inc()
             await interaction.response.send_message("⏭️ Skipped!", ephemeral=True)
         else:
             await interaction.response.send_message("Nothing is currently playing!", ephemeral=True)
     
     @discord.ui.button(label="⏹️ Stop", style=discord.ButtonStyle.danger)
     async def stop_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if bot.voice_client:
-            bot.voice_client.stop()
-        bot.queue.clear()
-        bot.current_song = None
-        bot.save_queue()
+        self.player.stop()
         await interaction.response.send_message("⏹️ Stopped and cleared queue!", ephemeral=True)
 
+QUEUE_PAGE_SIZE = 10
+
+def queue_page_count(queue) -> int:
+    return max(1, -(-len(queue) // QUEUE_PAGE_SIZE))
+
+class QueueJumpModal(discord.ui.Modal, title="Jump to page"):
+    page = discord.ui.TextInput(label="Page number", max_length=6)
+
+    def __init__(self, view: 'QueueView'):
+        super().__init__()
+        self.view = view
+        self.page.placeholder = f"1-{queue_page_count(view.player.queue)}"
+
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            self.view.page = int(self.page.value) - 1
+        except ValueError:
+            await interaction.response.send_message("Please enter a page number.", ephemeral=True)
+            return
+        await self.view.show(interaction)
+
 class QueueView(discord.ui.View):
-    def __init__(self, queue_data):
-        super().__init__(timeout=60)
-        self.queue_data = queue_data
+    """Queue listing that pages through the queue, rendering one page at a time."""
+
+    def __init__(self, player: GuildPlayer, page: int = 0):
+        super().__init__(timeout=120)
+        self.player = player
+        self.page = page
+        self.update_buttons()
     
-    @discord.ui.button(label="🔄 Refresh", style=discord.ButtonStyle.secondary)
-    async def refresh_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        embed = create_queue_embed(bot.queue)
+    def update_buttons(self):
+        pages = queue_page_count(self.player.queue)
+        self.page = min(max(self.page, 0), pages - 1)
+        self.prev_button.disabled = self.page == 0
+        self.next_button.disabled = self.page >= pages - 1
+        self.jump_button.disabled = pages == 1
+    
+    async def show(self, interaction: discord.Interaction):
+        self.update_buttons()
+        embed = create_queue_embed(self.player.queue, self.page)
         await interaction.response.edit_message(embed=embed, view=self)
     
-    @discord.ui.button(label="🗑️ Clear Queue", style=discord.ButtonStyle.danger)
+    @discord.ui.button(label="◀️ Prev", style=discord.ButtonStyle.secondary, row=0)
+    async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page -= 1
+        await self.show(interaction)
+    
+    @discord.ui.button(label="Next ▶️", style=discord.ButtonStyle.secondary, row=0)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await self.show(interaction)
+    
+    @discord.ui.button(label="🔢 Jump", style=discord.ButtonStyle.secondary, row=0)
+    async def jump_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.send_modal(QueueJumpModal(self))
+    
+    @discord.ui.button(label="🔄 Refresh", style=discord.ButtonStyle.secondary, row=1)
+    async def refresh_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction)
+    
+    @discord.ui.button(label="🗑️ Clear Queue", style=discord.ButtonStyle.danger, row=1)
     async def clear_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        bot.queue.clear()
-        bot.save_queue()
-        embed = create_queue_embed(bot.queue)
-        await interaction.response.edit_message(embed=embed, view=self)
+        self.player.clear()
+        self.page = 0
+        await self.show(interaction)
 
-def create_queue_embed(queue):
-    """Create queue embed"""
+def create_queue_embed(queue, page: int = 0):
+    """Create the queue embed for one page (0-based) of the queue"""
     embed = discord.Embed(title="🎵 Music Queue", color=0x00ff00)
     
     if not queue:
         embed.description = "Queue is empty!"
         return embed
     
-    for i, song in enumerate(queue[:10], 1):  # Show first 10 songs
-        embed.add_field(
-            name=f"{i}. {song['title']}",
-            value=f"by {song['artist']} | {song['duration']//60}:{song['duration']%60:02d}",
-            inline=False
-        )
-    
-    if len(queue) > 10:
-        embed.set_footer(text=f"... and {len(queue) - 10} more songs")
+    pages = queue_page_count(queue)
+    page = min(max(page, 0), pages - 1)
+    start = page * QUEUE_PAGE_SIZE
+    # Only the visible page is read from the queue; each track's line is formatted once
+    embed.description = "\n".join(
+        f"`{i}.` {track.queue_line}"
+        for i, track in enumerate(queue.page(start, QUEUE_PAGE_SIZE), start + 1)
+    )
+    embed.set_footer(text=f"Page {page + 1}/{pages} • {len(queue)} songs in queue")
     
     return embed
 
-@bot.command(name='play', aliases=['p'])
+# Autocomplete choices carry this prefix and a video ID, so picking one skips the search
+SUGGESTION_PREFIX = 'id:'
+
+@bot.hybrid_command(name='play', aliases=['p'])
+@app_commands.describe(query="Song to search for; suggestions come from tracks played before")
 async def play_song(ctx, *, query: str = None):
     """Play a song from YouTube Music or resume from queue"""
-    if not await bot.join_voice_channel(ctx):
+    requested_at = time.perf_counter()
+    # Slash commands must be answered within 3 seconds; joining voice can take longer
+    await ctx.defer()
+    player = bot.get_player(ctx.guild)
+    if not await player.join_voice_channel(ctx):
         return
     
     # If no query provided, try to play from queue
     if not query:
-        if bot.queue:
-            await bot.play_next_song(ctx)
+        if player.queue:
+            await player.play_next_song(ctx, requested_at=requested_at)
             return
         else:
             await ctx.send("❌ No song specified and queue is empty! Use `!play song name` to add a song.")
             return
     
-    # Show searching message
-    search_msg = await ctx.send("🔍 Searching for song...")
+    # A picked suggestion is already indexed: no search needed
+    song = None
+    if query.startswith(SUGGESTION_PREFIX):
+        song = bot.track_index.get(query[len(SUGGESTION_PREFIX):])
+    
+    if song is not None:
+        search_msg = await ctx.send("🎵 Adding song...")
+    else:
+        # Show searching message
+        search_msg = await ctx.send("🔍 Searching for song...")
+        
+        # Search for the song
+        results = await bot.youtube_api.search_song(query, max_results=1)
+        
+        if not results:
+            await search_msg.edit(content="❌ No results found!")
+            return
+        song = results[0]
     
-    # Search for the song
-    results = bot.youtube_api.search_song(query, max_results=1)
+    song_data = Track.from_dict(song, requested_by=ctx.author.display_name)
     
-    if not results:
-        await search_msg.edit(content="❌ No results found!")
+    if song_data.duration is None:
+        # The length lookup failed along with the search; an unchecked song is not queued
+        info = await bot.youtube_api.get_video_info(song_data.id)
+        song_data.duration = info.get('duration') if info else None
+    if song_data.duration is None:
+        await search_msg.edit(content="❌ Couldn't check the length of this song, please try again.")
         return
     
-    song_data = results[0]
-    
     # Check duration limit
-    if song_data['duration'] > Config.MAX_SONG_DURATION:
+    if song_data.duration > Config.MAX_SONG_DURATION:
         await search_msg.edit(content=f"❌ Song is too long! Maximum duration is {Config.MAX_SONG_DURATION//60} minutes.")
         return
     
     # Add to queue
-    song_data['requested_by'] = ctx.author.display_name
-    bot.queue.append(song_data)
-    bot.save_queue()
+    player.enqueue(song_data)
     
     # Update search message
     embed = discord.Embed(
         title="✅ Added to Queue",
-        description=f"**{song_data['title']}**\nby {song_data['artist']}",
+        description=f"**{song_data.title}**\nby {song_data.artist}",
         color=0x00ff00
     )
-    embed.set_thumbnail(url=song_data['thumbnail'])
-    embed.add_field(name="Position in queue", value=len(bot.queue))
-    embed.add_field(name="Duration", value=f"{song_data['duration']//60}:{song_data['duration']%60:02d}")
+    embed.set_thumbnail(url=song_data.thumbnail)
+    embed.add_field(name="Position in queue", value=len(player.queue))
+    embed.add_field(name="Duration", value=song_data.duration_text)
     
     await search_msg.edit(content="", embed=embed)
     
     # Start playing if not already playing
-    if not bot.voice_client.is_playing():
-        await bot.play_next_song(ctx)
+    if not player.voice_client.is_playing():
+        await player.play_next_song(ctx, requested_at=requested_at)
+    else:
+        player.prefetch_upcoming()
+
+@play_song.autocomplete('query')
+async def play_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+    """Suggest indexed tracks; answered from memory, well within Discord's 3-second window."""
+    return [
+        app_commands.Choice(name=song['label'][:100], value=f"{SUGGESTION_PREFIX}{song['id']}")
+        for song in bot.track_index.search(current, limit=25)
+    ]
+
+@bot.command(name='playlist', aliases=['pl'])
+async def play_playlist(ctx, url: str = None):
+    """Queue a YouTube / YouTube Music playlist, starting playback as soon as the first page loads"""
+    player = bot.get_player(ctx.guild)
+    playlist_id = bot.youtube_api.extract_playlist_id(url) if url else None
+    if not playlist_id:
+        await ctx.send("❌ Please provide a playlist link, e.g. `!playlist https://music.youtube.com/playlist?list=...`")
+        return
+    if len(player.queue) >= Config.MAX_QUEUE_SIZE:
+        await ctx.send(f"❌ Queue is full! Maximum is {Config.MAX_QUEUE_SIZE} songs.")
+        return
+    if not await player.join_voice_channel(ctx):
+        return
+    
+    status = await ctx.send("📃 Importing playlist...")
+    if not player.start_playlist_import(ctx, playlist_id, status):
+        await status.edit(content="❌ A playlist is already being imported, please wait for it to finish.")
 
 @bot.command(name='queue', aliases=['q'])
-async def show_queue(ctx):
+async def show_queue(ctx, page: int = 1):
     """Show the current queue with interactive buttons"""
-    embed = create_queue_embed(bot.queue)
-    view = QueueView(bot.queue)
+    player = bot.get_player(ctx.guild)
+    view = QueueView(player, page - 1)
+    embed = create_queue_embed(player.queue, view.page)
     await ctx.send(embed=embed, view=view)
 
 @bot.command(name='skip', aliases=['s'])
 async def skip_song(ctx):
     """Skip the current song"""
-    if not bot.voice_client or not bot.voice_client.is_playing():
+    player = bot.get_player(ctx.guild)
+    if not player.voice_client or not player.voice_client.is_playing():
         await ctx.send("Nothing is currently playing!")
         return
     
-    bot.voice_client.stop()
+    player.voice_client.stop()
+    metrics.SKIPS.inc()
     await ctx.send("⏭️ Skipped current song!")
 
 @bot.command(name='stop')
 async def stop_music(ctx):
     """Stop the music and clear the queue"""
-    if bot.voice_client:
-        bot.voice_client.stop()
-    
-    bot.queue.clear()
-    bot.current_song = None
-    bot.save_queue()
+    player = bot.get_player(ctx.guild)
+    player.stop()
     
     await ctx.send("⏹️ Stopped music and cleared queue!")
 
 @bot.command(name='pause')
 async def pause_music(ctx):
     """Pause the current song"""
-    if not bot.voice_client or not bot.voice_client.is_playing():
+    player = bot.get_player(ctx.guild)
+    if not player.voice_client or not player.voice_client.is_playing():
         await ctx.send("Nothing is currently playing!")
         return
     
-    bot.voice_client.pause()
+    player.voice_client.pause()
     await ctx.send("⏸️ Paused!")
 
 @bot.command(name='resume')
 async def resume_music(ctx):
     """Resume the paused song"""
-    if not bot.voice_client or bot.voice_client.is_playing():
+    player = bot.get_player(ctx.guild)
+    if not player.voice_client or player.voice_client.is_playing():
         await ctx.send("Nothing is paused!")
         return
     
-    bot.voice_client.resume()
+    player.voice_client.resume()
     await ctx.send("▶️ Resumed!")
 
+@bot.command(name='seek')
+async def seek_song(ctx, position: str):
+    """Jump to a position in the current song (seconds, M:SS or H:MM:SS)"""
+    player = bot.get_player(ctx.guild)
+    if player.source is None:
+        await ctx.send("Nothing is currently playing!")
+        return
+    
+    track = player.source.current.track
+    seconds = int(position) if position.isdigit() else AsyncYouTubeMusicAPI._parse_length(position)
+    if seconds is None:
+        await ctx.send("Invalid position! Use seconds or `M:SS`, e.g. `!seek 1:30`.")
+        return
+    if track.duration and seconds >= track.duration:
+        await ctx.send(f"Position is past the end of the song ({track.duration_text})!")
+        return
+    
+    if await player.seek(seconds):
+        await ctx.send(f"⏩ Jumped to {seconds//60}:{seconds%60:02d} in **{track.title}**")
+    else:
+        await ctx.send("❌ Could not seek in this song!")
+
 @bot.command(name='remove', aliases=['rm'])
 async def remove_song(ctx, position: int):
     """Remove a song from the queue by position"""
-    if not bot.queue:
+    player = bot.get_player(ctx.guild)
+    if not player.queue:
         await ctx.send("Queue is empty!")
         return
     
-    if position < 1 or position > len(bot.queue):
-        await ctx.send(f"Invalid position! Queue has {len(bot.queue)} songs.")
+    if position < 1 or position > len(player.queue):
+        await ctx.send(f"Invalid position! Queue has {len(player.queue)} songs.")
         return
     
-    removed_song = bot.queue.pop(position - 1)
-    bot.save_queue()
+    removed_song = player.remove_at(position - 1)
     
     embed = discord.Embed(
         title="🗑️ Song Removed",
-        description=f"**{removed_song['title']}**\nby {removed_song['artist']}",
+        description=f"**{removed_song.title}**\nby {removed_song.artist}",
         color=0xff0000
     )
     await ctx.send(embed=embed)
@@ -403,22 +1092,22 @@ async def remove_song(ctx, position: int):
 @bot.command(name='move', aliases=['mv'])
 async def move_song(ctx, from_pos: int, to_pos: int):
     """Move a song in the queue"""
-    if not bot.queue:
+    player = bot.get_player(ctx.guild)
+    if not player.queue:
         await ctx.send("Queue is empty!")
         return
     
-    if from_pos < 1 or from_pos > len(bot.queue) or to_pos < 1 or to_pos > len(bot.queue):
-        await ctx.send(f"Invalid positions! Queue has {len(bot.queue)} songs.")
+    if from_pos < 1 or from_pos > len(player.queue) or to_pos < 1 or to_pos > len(player.queue):
+        await ctx.send(f"Invalid positions! Queue has {len(player.queue)} songs.")
         return
     
     # Move the song
-    song = bot.queue.pop(from_pos - 1)
-    bot.queue.insert(to_pos - 1, song)
-    bot.save_queue()
+    song = player.move(from_pos - 1, to_pos - 1)
+    player.prefetch_upcoming()
     
     embed = discord.Embed(
         title="🔄 Song Moved",
-        description=f"**{song['title']}**\nMoved from position {from_pos} to {to_pos}",
+        description=f"**{song.title}**\nMoved from position {from_pos} to {to_pos}",
         color=0x00ff00
     )
     await ctx.send(embed=embed)
@@ -426,27 +1115,30 @@ async def move_song(ctx, from_pos: int, to_pos: int):
 @bot.command(name='shuffle')
 async def shuffle_queue(ctx):
     """Shuffle the queue"""
-    if len(bot.queue) < 2:
+    player = bot.get_player(ctx.guild)
+    if len(player.queue) < 2:
         await ctx.send("Need at least 2 songs to shuffle!")
         return
 
-    random.shuffle(bot.queue)
-    bot.save_queue()
+    player.shuffle()
+    player.prefetch_upcoming()
     
     await ctx.send("🔀 Queue shuffled!")
 
 @bot.command(name='radio', aliases=['rad'])
 async def radio_mode(ctx, toggle: str = None):
     """Toggle radio mode: when on, similar songs are auto-queued after each track (like YT Music)."""
+    player = bot.get_player(ctx.guild)
     if toggle is None:
-        status = "**ON** 📻" if bot.radio_mode else "**OFF**"
+        status = "**ON** 📻" if player.radio_mode else "**OFF**"
         await ctx.send(f"Radio mode is {status}. Use `!radio on` or `!radio off` to change.")
         return
     if toggle.lower() in ("on", "1", "yes", "enable"):
-        bot.radio_mode = True
-        await ctx.send("📻 **Radio mode ON** — similar songs will be auto-queued when the queue runs out.")
+        player.radio_mode = True
+        await ctx.send("📻 **Radio mode ON** — similar songs will be auto-queued when the queue runs low.")
+        player.maybe_refill_radio(ctx)
     elif toggle.lower() in ("off", "0", "no", "disable"):
-        bot.radio_mode = False
+        player.radio_mode = False
         await ctx.send("📻 **Radio mode OFF** — queue will stop when empty.")
     else:
         await ctx.send("Use `!radio on` or `!radio off`.")
@@ -454,26 +1146,19 @@ async def radio_mode(ctx, toggle: str = None):
 @bot.command(name='nowplaying', aliases=['np'])
 async def now_playing(ctx):
     """Show currently playing song"""
-    if not bot.current_song:
+    player = bot.get_player(ctx.guild)
+    if not player.current_song:
         await ctx.send("Nothing is currently playing!")
         return
     
-    embed = discord.Embed(
-        title="🎵 Now Playing",
-        description=f"**{bot.current_song['title']}**\nby {bot.current_song['artist']}",
-        color=0x00ff00
-    )
-    embed.set_thumbnail(url=bot.current_song['thumbnail'])
-    embed.add_field(name="Duration", value=f"{bot.current_song['duration']//60}:{bot.current_song['duration']%60:02d}")
-    embed.add_field(name="Requested by", value=bot.current_song['requested_by'])
-    
-    view = MusicControlView()
-    await ctx.send(embed=embed, view=view)
+    # Move the now-playing message (and its buttons) to the bottom of this channel
+    player.show_now_playing(ctx, player.current_song, repost=True)
 
 @bot.command(name='connect', aliases=['join'])
 async def connect_bot(ctx):
     """Connect the bot to your voice channel"""
-    if await bot.join_voice_channel(ctx):
+    player = bot.get_player(ctx.guild)
+    if await player.join_voice_channel(ctx):
         await ctx.send("🎵 Connected to voice channel! Use `!play song name` to start playing music!")
     else:
         await ctx.send("❌ Could not connect to voice channel!")
@@ -481,13 +1166,21 @@ async def connect_bot(ctx):
 @bot.command(name='disconnect', aliases=['dc'])
 async def disconnect_bot(ctx):
     """Disconnect the bot from voice channel"""
-    if bot.voice_client:
-        await bot.voice_client.disconnect()
-        bot.voice_client = None
+    player = bot.get_player(ctx.guild)
+    if player.voice_client:
+        await player.disconnect()
         await ctx.send("👋 Disconnected from voice channel!")
     else:
         await ctx.send("I'm not connected to any voice channel!")
 
+@bot.command(name='sync')
+@commands.is_owner()
+async def sync_commands(ctx):
+    """Register the slash commands with Discord (owner only; run after adding or changing one)"""
+    # Application commands are global, so this is not repeated on every start: Discord rate-limits syncs
+    synced = await bot.tree.sync()
+    await ctx.send(f"✅ Synced {len(synced)} slash command(s). They can take a few minutes to appear.")
+
 @bot.command(name='help_music')
 async def help_command(ctx):
     """Show help information"""
@@ -498,12 +1191,14 @@ async def help_command(ctx):
     )
     
     commands = [
-        ("!play <song>", "Play a song or add to queue"),
-        ("!queue", "Show current queue with buttons"),
+        ("!play <song>", "Play a song or add to queue (also /play, with suggestions)"),
+        ("!playlist <link>", "Add a YouTube / YouTube Music playlist to the queue"),
+        ("!queue [page]", "Show the queue, with page navigation buttons"),
         ("!skip", "Skip current song"),
         ("!stop", "Stop music and clear queue"),
         ("!pause", "Pause current song"),
         ("!resume", "Resume paused song"),
+        ("!seek <position>", "Jump to a position in the current song (e.g. 1:30)"),
         ("!remove <position>", "Remove song from queue"),
         ("!move <from> <to>", "Move song in queue"),
         ("!shuffle", "Shuffle the queue"),
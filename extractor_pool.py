@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+import metrics
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, NamedTuple, Optional, Tuple
+from config import Config
+
+# Opus mode prefers YouTube's Opus/WebM audio so ffmpeg can pass packets through untouched
+AUDIO_FORMAT = 'bestaudio[acodec=opus]/bestaudio/best' if Config.PLAYBACK_MODE == 'opus' else 'bestaudio/best'
+
+# YT-DLP options for extracting stream URL only (no download)
+YTDL_OPTS = {
+    'format': AUDIO_FORMAT,
+    'noplaylist': True,
+    'quiet': True,
+    'no_warnings': True,
+    'nocheckcertificate': True,
+    # On-disk cache for deciphered signature / n-parameter functions, shared across restarts
+    'cachedir': Config.YTDL_CACHE_DIR,
+    'http_headers': {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'en-us,en;q=0.5',
+    },
+}
+
+
+class StreamInfo(NamedTuple):
+    """A resolved audio stream and the codec/container it is delivered in."""
+    url: str
+    acodec: Optional[str] = None
+    ext: Optional[str] = None
+
+    @property
+    def is_opus(self) -> bool:
+        return self.acodec == 'opus'
+
+    @property
+    def is_local(self) -> bool:
+        """True for files on disk (the audio cache) rather than remote media URLs."""
+        return not self.url.startswith(('http://', 'https://'))
+
+
+# One long-lived YoutubeDL per worker thread/process. Reusing it keeps extractor
+# instances alive, so downloaded player JS and signature functions stay in memory.
+_worker = threading.local()
+
+
+def _init_worker(opts: Dict):
+    # Imported here so the bot process starts without loading yt-dlp
+    import yt_dlp
+    _worker.ydl = yt_dlp.YoutubeDL(opts)
+
+
+def _warm_worker():
+    """Load the YouTube extractor so the first real extraction skips it."""
+    _worker.ydl.get_info_extractor('Youtube')
+
+
+def _extract_stream(url: str) -> Tuple[Optional[StreamInfo], float]:
+    """Worker entry point: return (stream info, seconds spent extracting)."""
+    start = time.perf_counter()
+    try:
+        info = _worker.ydl.extract_info(url, download=False)
+        if not info:
+            return None, time.perf_counter() - start
+        fmt = info if info.get('url') else next(
+            (f for f in reversed(info.get('formats') or []) if f.get('vcodec') == 'none' and f.get('url')),
+            None
+        )
+        if fmt is None:
+            return None, time.perf_counter() - start
+        return StreamInfo(fmt['url'], fmt.get('acodec'), fmt.get('ext')), time.perf_counter() - start
+    except Exception as e:
+        print(f"Stream extract error: {e}")
+        return None, time.perf_counter() - start
+
+
+class ExtractorPool:
+    """Dedicated pool of warm yt-dlp extractors.
+
+    `mode` is 'thread' (default) or 'process'; process workers sidestep the GIL
+    for the CPU-heavy signature deciphering at the cost of more memory.
+    """
+
+    def __init__(self, size: int = None, mode: str = None, opts: Dict = None):
+        self.size = size or Config.EXTRACTOR_POOL_SIZE
+        self.mode = (mode or Config.EXTRACTOR_POOL_MODE).lower()
+        self.opts = opts or YTDL_OPTS
+        executor_cls = ProcessPoolExecutor if self.mode == 'process' else ThreadPoolExecutor
+        self._executor = executor_cls(max_workers=self.size, initializer=_init_worker, initargs=(self.opts,))
+
+        self.in_flight = 0
+        self.extractions = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time: Optional[float] = None
+
+    @property
+    def queue_depth(self) -> int:
+        """Extractions waiting for a free worker."""
+        return max(0, self.in_flight - self.size)
+
+    async def extract_stream(self, url: str) -> Optional[StreamInfo]:
+        """Resolve a direct audio stream on the pool (no download)."""
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            future = loop.run_in_executor(self._executor, _extract_stream, url)
+            stream, elapsed = await asyncio.wait_for(future, timeout=Config.EXTRACT_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            metrics.EXTRACT_TIME.observe(Config.EXTRACT_TIMEOUT)
+            print(f"Stream extract timed out after {Config.EXTRACT_TIMEOUT}s: {url}")
+            return None
+        finally:
+            self.in_flight -= 1
+
+        self.extractions += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.last_time = elapsed
+        metrics.EXTRACT_TIME.observe(elapsed)
+        if not stream:
+            self.failures += 1
+        return stream
+
+    def stats(self) -> Dict:
+        """Snapshot of pool load and extraction timing (seconds)."""
+        return {
+            'mode': self.mode,
+            'size': self.size,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'extractions': self.extractions,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'avg_time': self.total_time / self.extractions if self.extractions else None,
+            'max_time': self.max_time,
+            'last_time': self.last_time,
+        }
+
+    async def warm(self):
+        """Start every worker and load the YouTube extractor before the first request."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _warm_worker) for _ in range(self.size)))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+from config import Config
+from extractor_pool import StreamInfo
+
+# Boosts stop short of pushing a track's true peak above this (dBTP)
+TRUE_PEAK_LIMIT = -1.0
+# Smaller changes are inaudible and not worth giving up Opus passthrough for (dB)
+MIN_GAIN = 0.5
+
+
+class LoudnessCache:
+    """Per-track gain towards a common loudness, measured once and kept in SQLite.
+
+    Tracks are analysed in the background the first time they are queued or
+    played: ffmpeg's loudnorm filter reads the audio once and reports its
+    integrated loudness (LUFS) and true peak, and the audio is discarded. The
+    gain needed to reach `target` is stored by video ID, and the bot applies
+    it (in place of DEFAULT_VOLUME) as an ffmpeg `volume` filter on every later
+    play, so playback does no per-frame work in Python. A target of 0 disables
+    normalisation. SQLite is only read and written from worker threads; `load`
+    brings a track's stored gain into memory before its source is opened.
+    """
+
+    def __init__(self, resolve: Callable[..., Awaitable[Optional[StreamInfo]]], path: str = None,
+                 target: float = None, ffmpeg: str = 'ffmpeg'):
+        self.resolve = resolve
+        self.path = path or Config.LOUDNESS_PATH
+        self.target = Config.LOUDNESS_TARGET if target is None else target
+        self.ffmpeg = ffmpeg
+
+        self._lock = threading.Lock()
+        self._gains: Dict[str, float] = {}
+        self._analysing: Set[str] = set()
+        self._failed: Set[str] = set()
+        self._semaphore = asyncio.Semaphore(Config.LOUDNESS_CONCURRENCY)
+        self._db = self._open_db() if self.enabled else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.target != 0
+
+    def _open_db(self) -> Optional[sqlite3.Connection]:
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS loudness ("
+                "video_id TEXT PRIMARY KEY, integrated REAL, true_peak REAL, "
+                "target REAL NOT NULL, gain REAL NOT NULL, analysed REAL NOT NULL)"
+            )
+            db.commit()
+            return db
+        except Exception as e:
+            print(f"Loudness cache disabled ({self.path}): {e}")
+            return None
+
+    def gain(self, video_id: str) -> Optional[float]:
+        """The gain (dB) for a track, or None until it has been analysed (or `load`ed)."""
+        return self._gains.get(video_id)
+
+    async def load(self, video_id: str) -> Optional[float]:
+        """Read a track's stored gain into memory, off the event loop."""
+        if self._db is None:
+            return None
+        gain = self._gains.get(video_id)
+        if gain is None:
+            gain = await asyncio.to_thread(self._read_gain, video_id)
+            if gain is not None:
+                self._gains[video_id] = gain
+        return gain
+
+    def _read_gain(self, video_id: str) -> Optional[float]:
+        with self._lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT gain FROM loudness WHERE video_id = ? AND target = ?", (video_id, self.target)
+            ).fetchone()
+        return row[0] if row else None
+
+    def schedule(self, track):
+        """Analyse a track in the background unless its gain is already known."""
+        if (self._db is None or track.id in self._analysing or track.id in self._failed
+                or track.id in self._gains):
+            return
+        self._analysing.add(track.id)
+        asyncio.get_running_loop().create_task(self._analyse(track))
+
+    async def _analyse(self, track):
+        try:
+            if await self.load(track.id) is not None:
+                return
+            async with self._semaphore:
+                stream = await self.resolve(track)
+                if stream is None:
+                    return
+                measured = await self._measure(stream)
+            if measured is None:
+                self._failed.add(track.id)
+                return
+            integrated, true_peak = measured
+            gain = self.gain_for(integrated, true_peak)
+            await asyncio.to_thread(self._store, track.id, integrated, true_peak, gain)
+            self._gains[track.id] = gain
+        except Exception as e:
+            print(f"Error analysing loudness of {track.id}: {e}")
+            self._failed.add(track.id)
+        finally:
+            self._analysing.discard(track.id)
+
+    def _store(self, video_id: str, integrated: float, true_peak: float, gain: float):
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO loudness (video_id, integrated, true_peak, target, gain, analysed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, integrated, true_peak, self.target, gain, time.time()),
+            )
+            self._db.commit()
+
+    def gain_for(self, integrated: float, true_peak: float) -> float:
+        """Gain (dB) that brings a track to the target without raising its peak past the limit."""
+        if integrated == float('-inf'):
+            # Silence: nothing to normalise
+            return 0.0
+        gain = min(self.target - integrated, Config.LOUDNESS_MAX_GAIN)
+        if gain > 0:
+            gain = max(0.0, min(gain, TRUE_PEAK_LIMIT - true_peak))
+        return round(gain, 2)
+
+    async def _measure(self, stream: StreamInfo) -> Optional[Tuple[float, float]]:
+        """Run a loudnorm analysis pass; returns (integrated LUFS, true peak dBTP)."""
+        network = [] if stream.is_local else ['-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5']
+        process = await asyncio.create_subprocess_exec(
+            self.ffmpeg, '-nostdin', '-hide_banner', '-nostats', *network,
+            '-i', stream.url, '-vn', '-af', f'loudnorm=I={self.target}:TP={TRUE_PEAK_LIMIT}:print_format=json',
+            '-f', 'null', '-',
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+        output = stderr.decode(errors='replace')
+        if process.returncode != 0:
+            print(f"ffmpeg loudness analysis failed: {output.strip()[-300:]}")
+            return None
+        return self.parse_measurement(output)
+
+    @staticmethod
+    def parse_measurement(output: str) -> Optional[Tuple[float, float]]:
+        """Pull the input loudness and true peak out of loudnorm's JSON report."""
+        start, end = output.rfind('{'), output.rfind('}')
+        if start == -1 or end < start:
+            return None
+        try:
+            report = json.loads(output[start:end + 1])
+            return float(report['input_i']), float(report['input_tp'])
+        except (ValueError, KeyError):
+            return None
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
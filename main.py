@@ -1,5 +1,5 @@
 import os
-from discord_bot import bot
+from startup import timer
 from config import Config
 
 def main():
@@ -8,6 +8,15 @@ def main():
         # Validate configuration
         Config.validate()
         
+        if Config.CLUSTER_WORKERS > 0:
+            # Worker processes import the bot themselves, after taking their shard settings
+            from cluster import run_cluster
+            run_cluster()
+            return
+        
+        with timer.phase('import bot'):
+            from discord_bot import bot
+        
         print("Starting Discord Music Bot...")
         print("Bot will be available in Discord!")
         
@@ -0,0 +1,108 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+import discord
+import metrics
+from config import Config
+
+
+class _Update:
+    """Pending changes for one message: fields merge until the update is sent."""
+    __slots__ = ('key', 'message', 'fields', 'release')
+
+    def __init__(self, key: Hashable = None, message: discord.Message = None):
+        self.key = key          # keyed messages are looked up when the update is applied
+        self.message = message  # a specific message created elsewhere
+        self.fields: Dict = {}
+        self.release = False
+
+
+class ChannelDispatcher:
+    """Sends the bot's background messages for one text channel.
+
+    Updates are applied one at a time, with at least `min_interval` seconds
+    between REST calls. Updates to the same message merge while they wait,
+    so a burst of changes is sent as one edit. Keyed messages (e.g. now playing) are sent
+    on their first update and edited in place after that. No task is left
+    running while nothing is pending.
+    """
+
+    def __init__(self, channel: discord.abc.Messageable, min_interval: float = None):
+        self.channel = channel
+        self.min_interval = Config.MESSAGE_UPDATE_INTERVAL if min_interval is None else min_interval
+        self.messages: Dict[Hashable, discord.Message] = {}
+        self._pending: "OrderedDict[Hashable, _Update]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self._last_call = float('-inf')
+
+    def update(self, key: Hashable, **fields):
+        """Send the keyed message, or edit it in place once it exists."""
+        self._queue(key, _Update(key=key), fields)
+
+    def release(self, key: Hashable, **fields):
+        """Apply a last edit to the keyed message, then stop tracking it.
+
+        The next `update` for the key sends a new message. Nothing is sent
+        if the message was never created.
+        """
+        entry = self._pending.pop(key, None) or _Update(key=key)
+        entry.release = True
+        self._queue(object(), entry, fields)
+
+    def edit(self, message: discord.Message, **fields):
+        """Edit a message sent elsewhere (e.g. a command's status message)."""
+        self._queue(('edit', message.id), _Update(message=message), fields)
+
+    def post(self, **fields):
+        """Send a one-off message."""
+        self._queue(object(), _Update(), fields)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _queue(self, slot: Hashable, entry: _Update, fields: Dict):
+        queued = self._pending.setdefault(slot, entry)
+        if queued is not entry:
+            metrics.MESSAGE_UPDATES.inc(action='coalesced')
+        queued.fields.update(fields)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending:
+                wait = self._last_call + self.min_interval - loop.time()
+                if wait > 0:
+                    # Updates arriving during the wait merge into the queued ones
+                    await asyncio.sleep(wait)
+                _, entry = self._pending.popitem(last=False)
+                self._last_call = loop.time()
+                await self._apply(entry)
+        finally:
+            self._task = None
+
+    async def _apply(self, entry: _Update):
+        message = entry.message
+        if entry.key is not None:
+            message = self.messages.pop(entry.key, None) if entry.release else self.messages.get(entry.key)
+        try:
+            if message is not None:
+                try:
+                    await message.edit(**entry.fields)
+                    metrics.MESSAGE_UPDATES.inc(action='edit')
+                    return
+                except discord.NotFound:
+                    # Deleted by someone: a live keyed message is sent again below
+                    if entry.key is None or entry.release:
+                        return
+            elif entry.release:
+                return
+            fields = {k: v for k, v in entry.fields.items() if v is not None}
+            sent = await self.channel.send(**fields)
+            metrics.MESSAGE_UPDATES.inc(action='send')
+            if entry.key is not None:
+                self.messages[entry.key] = sent
+        except Exception as e:
+            print(f"Error updating message in channel {getattr(self.channel, 'id', '?')}: {e}")
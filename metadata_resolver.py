@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+# videos.list accepts at most 50 comma-separated IDs per request
+MAX_IDS_PER_REQUEST = 50
+
+
+class VideoMetadataResolver:
+    """Resolve video metadata in batches, sharing in-flight lookups between callers.
+
+    `fetch_batch` receives up to MAX_IDS_PER_REQUEST video IDs and returns a
+    dict of video_id -> metadata for the IDs that exist.
+    """
+
+    def __init__(self, fetch_batch: Callable[[List[str]], Dict[str, Dict]]):
+        self._fetch_batch = fetch_batch
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+
+    def resolve(self, video_ids: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """Return metadata for every requested ID (None for unknown videos)."""
+        owned = []
+        waiting = {}
+        with self._lock:
+            for vid in dict.fromkeys(v for v in video_ids if v):
+                future = self._in_flight.get(vid)
+                if future is None:
+                    future = Future()
+                    self._in_flight[vid] = future
+                    owned.append(vid)
+                waiting[vid] = future
+
+        for i in range(0, len(owned), MAX_IDS_PER_REQUEST):
+            self._resolve_chunk(owned[i:i + MAX_IDS_PER_REQUEST], waiting)
+
+        return {vid: future.result() for vid, future in waiting.items()}
+
+    def _resolve_chunk(self, chunk: List[str], waiting: Dict[str, Future]):
+        items = {}
+        try:
+            items = self._fetch_batch(chunk) or {}
+        except Exception as e:
+            print(f"Error resolving video metadata: {e}")
+        finally:
+            with self._lock:
+                for vid in chunk:
+                    self._in_flight.pop(vid, None)
+            for vid in chunk:
+                waiting[vid].set_result(items.get(vid))
+
+
+class AsyncVideoMetadataResolver:
+    """Event-loop variant of VideoMetadataResolver.
+
+    IDs requested within `batch_window` seconds of each other are sent in the
+    same videos.list requests, so concurrent commands share round trips.
+    """
+
+    def __init__(self, fetch_batch: Callable[[List[str]], Awaitable[Dict[str, Dict]]],
+                 batch_window: float = 0.01):
+        self._fetch_batch = fetch_batch
+        self._batch_window = batch_window
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._queued: List[str] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def resolve(self, video_ids: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """Return metadata for every requested ID (None for unknown videos)."""
+        loop = asyncio.get_running_loop()
+        waiting = {}
+        for vid in dict.fromkeys(v for v in video_ids if v):
+            future = self._in_flight.get(vid)
+            if future is None:
+                future = loop.create_future()
+                self._in_flight[vid] = future
+                self._queued.append(vid)
+            waiting[vid] = future
+
+        if self._queued and self._flush_task is None:
+            self._flush_task = loop.create_task(self._flush())
+
+        if waiting:
+            # asyncio.wait (unlike gather) leaves shared futures intact if this caller is cancelled
+            await asyncio.wait(list(waiting.values()))
+        return {vid: future.result() for vid, future in waiting.items()}
+
+    async def _flush(self):
+        await asyncio.sleep(self._batch_window)
+        queued, self._queued = self._queued, []
+        self._flush_task = None
+        chunks = [queued[i:i + MAX_IDS_PER_REQUEST] for i in range(0, len(queued), MAX_IDS_PER_REQUEST)]
+        await asyncio.gather(*(self._resolve_chunk(chunk) for chunk in chunks))
+
+    async def _resolve_chunk(self, chunk: List[str]):
+        items = {}
+        try:
+            items = await self._fetch_batch(chunk) or {}
+        except Exception as e:
+            print(f"Error resolving video metadata: {e}")
+        finally:
+            for vid in chunk:
+                future = self._in_flight.pop(vid, None)
+                if future is not None and not future.done():
+                    future.set_result(items.get(vid))
@@ -0,0 +1,215 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from aiohttp import web
+from config import Config
+
+# Latency buckets in seconds, from cache hits up to slow extractions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: List['_Metric'] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(pairs) -> str:
+    pairs = list(pairs)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels."""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_label_text(zip(self.labelnames, key))} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Current value, either set directly or read from a callback at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self._value = value
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def value(self) -> float:
+        if self._function is not None:
+            try:
+                return self._function()
+            except Exception as e:
+                print(f"Error reading gauge {self.name}: {e}")
+                return 0.0
+        return self._value
+
+    def render(self) -> List[str]:
+        return super().render() + [f"{self.name} {_format_value(self.value())}"]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram of observed durations (seconds)."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @contextmanager
+    def time(self):
+        """Observe the wall time spent inside a `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        cumulative = 0
+        for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{_label_text([('le', _format_value(bound))])} {cumulative}")
+        lines.append(f"{self.name}_sum {_format_value(total)}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+SEARCH_LATENCY = Histogram('musicbot_search_seconds', 'search_song latency, including cache hits.')
+EXTRACT_TIME = Histogram(
+    'musicbot_extract_seconds', 'yt-dlp stream extraction time.',
+    buckets=(0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0),
+)
+TIME_TO_FIRST_AUDIO = Histogram(
+    'musicbot_time_to_first_audio_seconds', 'Time from a !play command to its first audio frame.',
+    buckets=(0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0),
+)
+RADIO_REFILL_TIME = Histogram('musicbot_radio_refill_seconds', 'Time to fetch and queue a radio refill.')
+
+API_ERRORS = Counter('musicbot_api_errors_total', 'Failed upstream API calls.', ['endpoint'])
+UPSTREAM_CALLS = Counter(
+    'musicbot_upstream_calls_total', 'Upstream calls by backend and result (ok, error, client_error, timeout, rejected).',
+    ['backend', 'result']
+)
+HEDGES = Counter(
+    'musicbot_hedged_lookups_total', 'Lookups that started their secondary source, by the source that won.',
+    ['operation', 'winner']
+)
+CACHE_LOOKUPS = Counter('musicbot_cache_lookups_total', 'Cache lookups by cache and result.', ['cache', 'result'])
+FFMPEG_FAILURES = Counter('musicbot_ffmpeg_failures_total', 'Audio sources that failed to open or play.')
+SKIPS = Counter('musicbot_skips_total', 'Songs skipped by users.')
+PLAYBACK_RESTARTS = Counter(
+    'musicbot_playback_restarts_total', 'Tracks reopened at an offset, by reason (resume, seek).', ['reason']
+)
+MESSAGE_UPDATES = Counter(
+    'musicbot_message_updates_total', 'Background Discord messages sent, edited or merged into a pending edit.',
+    ['action']
+)
+
+VOICE_SESSIONS = Gauge('musicbot_voice_sessions', 'Guilds with an active voice connection.')
+EXTRACT_QUEUE_DEPTH = Gauge('musicbot_extract_queue_depth', 'Extractions waiting for a free pool worker.')
+QUOTA_REMAINING = Gauge('musicbot_quota_remaining', 'YouTube Data API units left today.')
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_server(host: str = None, port: int = None) -> Optional[web.AppRunner]:
+    """Serve /metrics on host:port; returns the runner, or None when disabled."""
+    host = host or Config.METRICS_HOST
+    port = Config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get('/metrics', _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        print(f"Metrics endpoint disabled, could not bind {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    return runner
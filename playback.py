@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+import discord
+from config import Config
+
+# discord.py pulls one 20 ms frame per read()
+FRAME_SECONDS = 0.02
+
+
+class TrackSource(discord.AudioSource):
+    """Wraps an ffmpeg source for one track, tracking playback position.
+
+    `prime()` reads frames ahead of time so playback starts from memory, and
+    `on_start` is called (from the audio thread) when the first frame is played.
+    """
+
+    def __init__(self, track, source: discord.AudioSource, start_offset: float = 0.0,
+                 on_start: Callable[['TrackSource'], None] = None):
+        self.track = track
+        self.source = source
+        self.start_offset = start_offset
+        self.on_start = on_start
+        self.frames = 0
+        self.first_read_at: Optional[float] = None
+        self.finished = False
+        self._buffer = deque()
+
+    @property
+    def position(self) -> float:
+        """Seconds into the track that have been handed to the voice client."""
+        return self.start_offset + self.frames * FRAME_SECONDS
+
+    @property
+    def ended_early(self) -> bool:
+        """True when the stream ran dry well before the track's known end (e.g. an expired URL)."""
+        duration = self.track.duration
+        return self.finished and bool(duration) and self.position < duration - Config.RESUME_MARGIN
+
+    def prime(self, frames: int):
+        """Pre-read up to `frames` frames (blocking; run in a worker thread)."""
+        while len(self._buffer) < frames:
+            data = self.source.read()
+            if not data:
+                break
+            self._buffer.append(data)
+
+    def read(self) -> bytes:
+        data = self._buffer.popleft() if self._buffer else self.source.read()
+        if not data:
+            self.finished = True
+            return b''
+        if self.first_read_at is None:
+            self.first_read_at = time.perf_counter()
+            if self.on_start:
+                self.on_start(self)
+        self.frames += 1
+        return data
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self._buffer.clear()
+        self.source.cleanup()
+
+
+class GaplessSource(discord.AudioSource):
+    """Plays the current TrackSource and switches to a pre-opened next one in-place.
+
+    When the current track runs out and a next source has been set, the switch
+    happens inside read(), so the voice client never stops between tracks.
+    `on_transition(new_source, ended_at)` is called from the audio thread.
+    A track that ends early is not followed by the next one: playback stops so
+    the player can resume it. `replace()` swaps the current source (e.g. after
+    a seek) on the next read.
+    """
+
+    def __init__(self, current: TrackSource,
+                 on_transition: Callable[[TrackSource, float], None]):
+        self.current = current
+        self.on_transition = on_transition
+        self._next: Optional[TrackSource] = None
+        self._replacement: Optional[TrackSource] = None
+        self._lock = threading.Lock()
+
+    @property
+    def next(self) -> Optional[TrackSource]:
+        return self._next
+
+    def set_next(self, source: TrackSource):
+        with self._lock:
+            self._next = source
+
+    def take_next(self) -> Optional[TrackSource]:
+        """Detach and return the pending next source, if any."""
+        with self._lock:
+            source, self._next = self._next, None
+        return source
+
+    def replace(self, source: TrackSource):
+        """Play `source` instead of the current one from the next frame on."""
+        with self._lock:
+            stale, self._replacement = self._replacement, source
+        if stale is not None:
+            threading.Thread(target=stale.cleanup, daemon=True).start()
+
+    def read(self) -> bytes:
+        if self._replacement is not None:
+            with self._lock:
+                source, self._replacement = self._replacement, None
+            replaced, self.current = self.current, source
+            threading.Thread(target=replaced.cleanup, daemon=True).start()
+
+        data = self.current.read()
+        if data or self.current.ended_early:
+            return data
+
+        ended_at = time.perf_counter()
+        upcoming = self.take_next()
+        if upcoming is None:
+            return b''
+
+        finished, self.current = self.current, upcoming
+        # Killing ffmpeg can block briefly; keep it off the audio thread
+        threading.Thread(target=finished.cleanup, daemon=True).start()
+        data = upcoming.read()
+        self.on_transition(upcoming, ended_at)
+        return data
+
+    def is_opus(self) -> bool:
+        return self.current.is_opus()
+
+    def cleanup(self):
+        self.current.cleanup()
+        with self._lock:
+            replacement, self._replacement = self._replacement, None
+        for source in (replacement, self.take_next()):
+            if source is not None:
+                source.cleanup()
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+from config import Config
+
+
+def apply_op(queue: List, op: Dict):
+    """Apply one journaled queue operation to a list in place."""
+    kind = op['op']
+    if kind == 'append':
+        queue.extend(op['songs'])
+    elif kind == 'insert':
+        queue.insert(op['index'], op['song'])
+    elif kind == 'pop':
+        del queue[op['index']]
+    elif kind == 'move':
+        queue.insert(op['to'], queue.pop(op['from']))
+    elif kind == 'reorder':
+        queue[:] = [queue[i] for i in op['order']]
+    elif kind == 'clear':
+        queue.clear()
+    else:
+        raise ValueError(f"Unknown queue operation: {kind}")
+
+
+class QueueJournal:
+    """Append-only journal of queue operations with periodic compaction.
+
+    Operations are buffered on the event loop and written from a worker thread
+    after `flush_delay` seconds, so bursts of edits cost one write. Every
+    `compact_every` operations the full queue is written to `snapshot_path`
+    (atomically, via rename) and the journal is truncated. Each operation
+    carries a sequence number that the snapshot records, so a crash between
+    the two steps never replays an operation twice.
+    """
+
+    def __init__(self, snapshot_path: str, state: Callable[[], List[Dict]],
+                 flush_delay: float = None, compact_every: int = None):
+        self.snapshot_path = snapshot_path
+        self.journal_path = os.path.splitext(snapshot_path)[0] + '.journal'
+        self.state = state
+        self.flush_delay = Config.QUEUE_FLUSH_DELAY if flush_delay is None else flush_delay
+        self.compact_every = compact_every or Config.QUEUE_COMPACT_OPS
+
+        self._seq = 0
+        self._pending: List[Dict] = []
+        self._ops_since_compact = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    def load(self, fallback_path: str = None) -> List[Dict]:
+        """Rebuild the queue from the snapshot plus any journaled operations after it."""
+        queue, snapshot_seq = self._read_snapshot(self.snapshot_path)
+        if queue is None and fallback_path:
+            queue, snapshot_seq = self._read_snapshot(fallback_path)
+        queue = queue or []
+        self._seq = snapshot_seq
+
+        if os.path.exists(self.journal_path):
+            good_end = 0
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError("incomplete line")
+                        op = json.loads(line)
+                    except ValueError:
+                        # Torn final write from a crash: everything before it is intact
+                        break
+                    good_end += len(line)
+                    if op['seq'] <= snapshot_seq:
+                        continue
+                    apply_op(queue, op)
+                    self._seq = op['seq']
+                    self._ops_since_compact += 1
+                torn = f.seek(0, os.SEEK_END) > good_end
+            if torn:
+                # Cut the torn tail off before anything is appended after it, or the
+                # next load would stop there again and lose every later operation
+                with open(self.journal_path, 'r+b') as f:
+                    f.truncate(good_end)
+                    os.fsync(f.fileno())
+        return queue
+
+    @staticmethod
+    def _read_snapshot(path: str):
+        if not os.path.exists(path):
+            return None, 0
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # Plain lists are the original queue.json format
+        if isinstance(data, list):
+            return data, 0
+        return data['queue'], data.get('seq', 0)
+
+    def record(self, op: str, **fields):
+        """Journal one operation; it is written on the next debounced flush."""
+        self._seq += 1
+        self._pending.append({'seq': self._seq, 'op': op, **fields})
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(*self._take_batch())
+            return
+        if self._flush_task is None:
+            self._flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        """Write pending operations (and a snapshot, when due) off the event loop."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            ops, snapshot = self._take_batch()
+            if ops or snapshot is not None:
+                await asyncio.to_thread(self._write, ops, snapshot)
+
+    def _take_batch(self):
+        ops, self._pending = self._pending, []
+        self._ops_since_compact += len(ops)
+        snapshot = None
+        if self._ops_since_compact >= self.compact_every:
+            snapshot = {'seq': self._seq, 'queue': list(self.state())}
+            self._ops_since_compact = 0
+        return ops, snapshot
+
+    def _write(self, ops: List[Dict], snapshot: Optional[Dict]):
+        try:
+            with self._write_lock:
+                os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+                if snapshot is not None:
+                    self._write_snapshot(snapshot)
+                    # The snapshot covers every journaled op, so start a fresh journal
+                    open(self.journal_path, 'w').close()
+                elif ops:
+                    with open(self.journal_path, 'a', encoding='utf-8') as f:
+                        f.write(''.join(json.dumps(op, ensure_ascii=False) + '\n' for op in ops))
+                        f.flush()
+                        os.fsync(f.fileno())
+        except Exception as e:
+            print(f"Error saving queue: {e}")
+
+    def _write_snapshot(self, snapshot: Dict):
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    async def compact(self):
+        """Force a snapshot now (used on shutdown)."""
+        self._ops_since_compact = self.compact_every
+        await self.flush()
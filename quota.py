@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+from config import Config
+
+try:
+    from zoneinfo import ZoneInfo
+    # Data API quota resets at midnight Pacific Time
+    _QUOTA_TZ = ZoneInfo('America/Los_Angeles')
+except Exception:
+    _QUOTA_TZ = timezone(timedelta(hours=-8))
+
+# Quota units charged per call for the Data API endpoints the bot uses
+ENDPOINT_COSTS = {
+    'search': 100,
+    'videos': 1,
+    'playlistItems': 1,
+}
+
+# User-initiated calls (!play) may spend down to QUOTA_USER_RESERVE; background
+# traffic (radio fallback) stops at the larger QUOTA_BACKGROUND_RESERVE
+PRIORITY_USER = 'user'
+PRIORITY_BACKGROUND = 'background'
+
+
+class QuotaExceeded(Exception):
+    """Raised instead of making a Data API call the daily budget cannot cover."""
+
+
+class QuotaTracker:
+    """Daily YouTube Data API quota budget, persisted across restarts."""
+
+    def __init__(self, path: str = None, daily_limit: int = None):
+        self.path = path or Config.QUOTA_STATE_PATH
+        self.daily_limit = daily_limit or Config.QUOTA_DAILY_LIMIT
+        self.reserves = {
+            PRIORITY_USER: Config.QUOTA_USER_RESERVE,
+            PRIORITY_BACKGROUND: Config.QUOTA_BACKGROUND_RESERVE,
+        }
+        self.denied = 0
+
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._day = self._today()
+        self._used: Dict[str, int] = {}
+        self._load()
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(_QUOTA_TZ).date().isoformat()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('day') == self._day:
+                self._used = {k: int(v) for k, v in data.get('used', {}).items()}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading quota usage: {e}")
+
+    def _roll_over(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self._used = {}
+            self._dirty = True
+
+    @property
+    def used(self) -> int:
+        with self._lock:
+            self._roll_over()
+            return sum(self._used.values())
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.daily_limit - self.used)
+
+    def acquire(self, endpoint: str, priority: str = PRIORITY_USER):
+        """Charge one call to today's usage, or raise QuotaExceeded."""
+        cost = ENDPOINT_COSTS.get(endpoint, 1)
+        with self._lock:
+            self._roll_over()
+            remaining = self.daily_limit - sum(self._used.values())
+            if remaining - cost < self.reserves.get(priority, 0):
+                self.denied += 1
+                raise QuotaExceeded(f"{endpoint} needs {cost} units, {remaining} left today")
+            self._used[endpoint] = self._used.get(endpoint, 0) + cost
+            self._dirty = True
+
+    def refund(self, endpoint: str):
+        """Give back a call's units when it never got an answer from YouTube."""
+        cost = ENDPOINT_COSTS.get(endpoint, 1)
+        with self._lock:
+            self._roll_over()
+            if self._used.get(endpoint, 0) >= cost:
+                self._used[endpoint] -= cost
+                self._dirty = True
+
+    def exhaust(self):
+        """Mark today's budget as spent (the API reported quotaExceeded)."""
+        with self._lock:
+            self._roll_over()
+            spent = sum(self._used.values())
+            if spent < self.daily_limit:
+                self._used['external'] = self._used.get('external', 0) + self.daily_limit - spent
+                self._dirty = True
+
+    def save(self):
+        """Write today's usage to disk if it changed (blocking; run in a worker thread)."""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = {'day': self._day, 'used': dict(self._used)}
+                self._dirty = False
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"Error saving quota usage: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._roll_over()
+            used = dict(self._used)
+        return {
+            'day': self._day,
+            'used': sum(used.values()),
+            'remaining': max(0, self.daily_limit - sum(used.values())),
+            'by_endpoint': used,
+            'denied': self.denied,
+        }
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from config import Config
+
+
+class RelatedGraph:
+    """Persistent video_id -> related songs graph backed by SQLite.
+
+    Each node stores the related song dicts it was fetched with and when. Nodes
+    older than `ttl` seconds are reported as stale so callers can refresh them,
+    but are kept around as a fallback until pruned by the `max_nodes` bound.
+    """
+
+    def __init__(self, path: str = None, ttl: float = None, max_nodes: int = None):
+        self.path = path or Config.RELATED_GRAPH_PATH
+        self.ttl = ttl or Config.RELATED_GRAPH_TTL
+        self.max_nodes = max_nodes or Config.RELATED_GRAPH_SIZE
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._db = self._open_db()
+
+    def _open_db(self) -> Optional[sqlite3.Connection]:
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS related_tracks ("
+                "video_id TEXT PRIMARY KEY, related TEXT NOT NULL, source TEXT NOT NULL, "
+                "fetched REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS related_tracks_accessed ON related_tracks(accessed)")
+            db.commit()
+            return db
+        except Exception as e:
+            print(f"Related-track graph disabled ({self.path}): {e}")
+            return None
+
+    def get(self, video_id: str) -> Tuple[Optional[List[Dict]], bool]:
+        """Return (related songs or None, whether the node is still fresh)."""
+        if self._db is None:
+            return None, False
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._db.execute(
+                    "SELECT related, fetched FROM related_tracks WHERE video_id = ?", (video_id,)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None, False
+                self._db.execute("UPDATE related_tracks SET accessed = ? WHERE video_id = ?", (now, video_id))
+                self._db.commit()
+            except Exception as e:
+                print(f"Error reading related-track graph: {e}")
+                return None, False
+
+        fresh = now - row[1] < self.ttl
+        if fresh:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+        return json.loads(row[0]), fresh
+
+    def put(self, video_id: str, related: List[Dict], source: str):
+        """Store the related songs for a video, replacing any older node."""
+        if self._db is None or not related:
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO related_tracks (video_id, related, source, fetched, accessed) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (video_id, json.dumps(related, ensure_ascii=False), source, now, now),
+                )
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= 100:
+                    self._prune()
+                self._db.commit()
+            except Exception as e:
+                print(f"Error writing related-track graph: {e}")
+
+    def _prune(self):
+        """Drop the least recently used nodes beyond the size bound."""
+        self._writes_since_prune = 0
+        self._db.execute(
+            "DELETE FROM related_tracks WHERE video_id IN ("
+            "SELECT video_id FROM related_tracks ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_nodes,),
+        )
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class RecentlyPlayedFilter:
+    """Rolling Bloom filter of recently played video IDs.
+
+    Two generations of `capacity` entries each: when the current one fills up
+    it becomes the previous one and the oldest is dropped, so membership covers
+    roughly the last `capacity` to `2 * capacity` plays in a few kilobytes.
+    False positives (skipping an unplayed track) happen at about `error_rate`.
+    """
+
+    def __init__(self, capacity: int = None, error_rate: float = 0.01):
+        self.capacity = capacity or Config.RADIO_DEDUP_SIZE
+        # Standard sizing: m = -n ln p / (ln 2)^2 bits, k = (m / n) ln 2 hashes
+        self.num_bits = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self._current = bytearray((self.num_bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+
+    def _positions(self, video_id: str):
+        digest = hashlib.blake2b(video_id.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    @staticmethod
+    def _test(bits: bytearray, positions) -> bool:
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def add(self, video_id: str):
+        positions = self._positions(video_id)
+        if self._test(self._current, positions):
+            return
+        if self._count >= self.capacity:
+            self._previous, self._current = self._current, bytearray(len(self._current))
+            self._count = 0
+        for p in positions:
+            self._current[p >> 3] |= 1 << (p & 7)
+        self._count += 1
+
+    def __contains__(self, video_id: str) -> bool:
+        positions = self._positions(video_id)
+        return self._test(self._current, positions) or self._test(self._previous, positions)
+
@@ -0,0 +1,182 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+import metrics
+from config import Config
+
+# Percentiles are not trusted (and hedging waits HEDGE_MAX_DELAY) until this many samples exist
+MIN_SAMPLES = 20
+
+
+class BackendUnavailable(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calling a backend that keeps failing.
+
+    Opens after `failure_threshold` consecutive failures. Once `reset_timeout`
+    seconds have passed, a single trial call is let through (half-open);
+    success closes the breaker, failure re-opens it. A trial that never
+    reports back (e.g. cancelled) frees the slot after another `reset_timeout`.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = None, reset_timeout: float = None):
+        self.failure_threshold = failure_threshold or Config.BREAKER_FAILURES
+        self.reset_timeout = Config.BREAKER_RESET if reset_timeout is None else reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return False
+        # Let one trial through; the clock restarts so concurrent callers keep waiting
+        self.state = self.HALF_OPEN
+        self._opened_at = time.monotonic()
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+class LatencyWindow:
+    """The most recent latencies of one operation, for percentile estimates."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """The p-th percentile (0-100), or None while there are too few samples."""
+        if len(self._samples) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class Backend:
+    """One upstream source: its circuit breaker and per-call latency budget.
+
+    `is_failure(error)` decides whether an error says the backend is unhealthy;
+    errors it rejects (such as a 404 for a bad link) leave the breaker alone.
+    """
+
+    def __init__(self, name: str, timeout: float, breaker: CircuitBreaker = None,
+                 is_failure: Callable[[Exception], bool] = None):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.is_failure = is_failure or (lambda error: True)
+
+    async def call(self, endpoint: str, fn: Callable[[], Awaitable]) -> Any:
+        """Await `fn()` within the budget; failures and timeouts count against the breaker."""
+        if not self.breaker.allow():
+            metrics.UPSTREAM_CALLS.inc(backend=self.name, result='rejected')
+            raise BackendUnavailable(f"{self.name} circuit open after {self.breaker.failures} failures")
+        try:
+            result = await asyncio.wait_for(fn(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self._failed(endpoint, 'timeout')
+            raise asyncio.TimeoutError(f"{endpoint} took longer than {self.timeout}s")
+        except asyncio.CancelledError:
+            # Lost a hedge race (or the caller gave up): says nothing about the backend
+            raise
+        except Exception as e:
+            if self.is_failure(e):
+                self._failed(endpoint, 'error')
+            else:
+                metrics.UPSTREAM_CALLS.inc(backend=self.name, result='client_error')
+                metrics.API_ERRORS.inc(endpoint=endpoint)
+            raise
+        self.breaker.record_success()
+        metrics.UPSTREAM_CALLS.inc(backend=self.name, result='ok')
+        return result
+
+    def _failed(self, endpoint: str, result: str):
+        self.breaker.record_failure()
+        metrics.UPSTREAM_CALLS.inc(backend=self.name, result=result)
+        metrics.API_ERRORS.inc(endpoint=endpoint)
+
+
+class Hedge:
+    """Races a secondary source against a slow primary.
+
+    The secondary starts when the primary fails, or when it has run longer
+    than the HEDGE_PERCENTILE of its recent latencies. The first acceptable
+    result wins and the other call is cancelled.
+    """
+
+    def __init__(self, name: str, percentile: float = None):
+        self.name = name
+        self.percentile = percentile or Config.HEDGE_PERCENTILE
+        self.latency = LatencyWindow()
+
+    def delay(self) -> float:
+        observed = self.latency.percentile(self.percentile)
+        if observed is None:
+            return Config.HEDGE_MAX_DELAY
+        return min(max(observed, Config.HEDGE_MIN_DELAY), Config.HEDGE_MAX_DELAY)
+
+    async def run(self, primary: Callable[[], Awaitable], secondary: Callable[[], Awaitable],
+                  accept: Callable[[Any], bool] = bool) -> Any:
+        """Return the first result `accept` approves (else the last one); raise if both calls fail."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        primary_task = loop.create_task(primary())
+        secondary_task = None
+        pending = {primary_task}
+        result = error = None
+        try:
+            await asyncio.wait(pending, timeout=self.delay())
+            if not primary_task.done():
+                secondary_task = loop.create_task(secondary())
+                pending.add(secondary_task)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is primary_task:
+                            self.latency.observe(loop.time() - started)
+                        result = task.result()
+                        if accept(result):
+                            self._won(task is primary_task, secondary_task is not None)
+                            return result
+                    else:
+                        error = task.exception()
+                        if task is primary_task and not isinstance(error, BackendUnavailable):
+                            print(f"{self.name}: primary source failed ({error}), using the fallback")
+                    if task is primary_task and secondary_task is None:
+                        secondary_task = loop.create_task(secondary())
+                        pending.add(secondary_task)
+            if result is None and error is not None:
+                raise error
+            return result
+        finally:
+            for task in pending:
+                task.cancel()
+            if not primary_task.done():
+                # Cancelled by the hedge: it took at least this long, which keeps the tail visible
+                self.latency.observe(loop.time() - started)
+
+    def _won(self, primary_won: bool, hedged: bool):
+        if hedged:
+            metrics.HEDGES.inc(operation=self.name, winner='primary' if primary_won else 'secondary')
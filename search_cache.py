@@ -0,0 +1,173 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+from config import Config
+
+
+class SearchCache:
+    """Two-tier cache of search results: an in-memory LRU in front of SQLite.
+
+    Queries are keyed by `normalize(query)` so trivially different spellings of
+    the same search share an entry. Entries older than `ttl` seconds are ignored.
+    """
+
+    def __init__(self, normalize: Callable[[str], str], path: str = None, ttl: float = None,
+                 memory_size: int = None, disk_size: int = None):
+        self.normalize = normalize
+        self.path = path or Config.SEARCH_CACHE_PATH
+        self.ttl = ttl or Config.SEARCH_CACHE_TTL
+        self.memory_size = memory_size or Config.SEARCH_CACHE_MEMORY_SIZE
+        self.disk_size = disk_size or Config.SEARCH_CACHE_DISK_SIZE
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._db = self._open_db()
+
+    def _open_db(self) -> Optional[sqlite3.Connection]:
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "key TEXT PRIMARY KEY, results TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS search_cache_accessed ON search_cache(accessed)")
+            db.commit()
+            return db
+        except Exception as e:
+            print(f"Search cache disabled on disk ({self.path}): {e}")
+            return None
+
+    def _key(self, query: str, max_results: int) -> str:
+        return f"{max_results}:{self.normalize(query)}"
+
+    def get(self, query: str, max_results: int) -> Optional[List[Dict]]:
+        """Return cached results for a query, or None on a miss."""
+        key = self._key(query, max_results)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                results, created = entry
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return [dict(r) for r in results]
+                del self._memory[key]
+
+            results = self._get_disk(key, now)
+            if results is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            return [dict(r) for r in results]
+
+    def _get_disk(self, key: str, now: float) -> Optional[List[Dict]]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT results, created FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                return None
+            self._db.execute("UPDATE search_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            results = json.loads(row[0])
+            self._remember(key, results, row[1])
+            return results
+        except Exception as e:
+            print(f"Error reading search cache: {e}")
+            return None
+
+    def put(self, query: str, max_results: int, results: List[Dict]):
+        """Store results for a query in both tiers.
+
+        Results with an unknown duration (a failed videos.list lookup) are not
+        cached, so the next search gets another chance to resolve them.
+        """
+        if not results or any(r.get('duration') is None for r in results):
+            return
+        key = self._key(query, max_results)
+        now = time.time()
+        results = [dict(r) for r in results]
+        with self._lock:
+            self._remember(key, results, now)
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, results, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(results, ensure_ascii=False), now, now),
+                )
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= 100:
+                    self._prune(now)
+                self._db.commit()
+            except Exception as e:
+                print(f"Error writing search cache: {e}")
+
+    def songs(self, limit: int) -> List[Dict]:
+        """Up to `limit` distinct songs from the most recently used entries on disk."""
+        if self._db is None or limit <= 0:
+            return []
+        songs: Dict[str, Dict] = {}
+        with self._lock:
+            try:
+                rows = self._db.execute(
+                    "SELECT results FROM search_cache WHERE created >= ? ORDER BY accessed DESC",
+                    (time.time() - self.ttl,),
+                )
+                for (results,) in rows:
+                    for song in json.loads(results):
+                        songs.setdefault(song['id'], song)
+                    if len(songs) >= limit:
+                        break
+            except Exception as e:
+                print(f"Error reading search cache: {e}")
+        return list(songs.values())[:limit]
+
+    def _remember(self, key: str, results: List[Dict], created: float):
+        self._memory[key] = (results, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _prune(self, now: float):
+        """Drop expired rows and the least recently used rows beyond the disk limit."""
+        self._writes_since_prune = 0
+        self._db.execute("DELETE FROM search_cache WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM search_cache WHERE key IN ("
+            "SELECT key FROM search_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.disk_size,),
+        )
+
+    def stats(self) -> Dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else None,
+            'memory_entries': len(self._memory),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
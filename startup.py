@@ -0,0 +1,34 @@
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+
+class StartupTimer:
+    """Offsets and durations of startup phases, measured from process start."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # (name, offset from start, duration) in seconds
+        self.phases: List[Tuple[str, float, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start - self.started, time.perf_counter() - start))
+
+    def mark(self, name: str):
+        """Record a milestone, such as the gateway becoming ready."""
+        self.phases.append((name, time.perf_counter() - self.started, 0.0))
+
+    def report(self) -> str:
+        lines = ["Startup timing (offset from process start, duration):"]
+        for name, offset, duration in sorted(self.phases, key=lambda p: p[1]):
+            lines.append(f"  {name:<20} +{offset * 1000:8.1f} ms  {duration * 1000:8.1f} ms")
+        return '\n'.join(lines)
+
+
+# Imported first by main.py, so offsets include importing the bot
+timer = StartupTimer()
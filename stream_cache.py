@@ -0,0 +1,120 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+from urllib.parse import parse_qs, urlparse
+import metrics
+from config import Config
+
+# googlevideo URLs carry their expiry either as ?expire=<unix ts> or as /expire/<unix ts>/ (manifests)
+_PATH_EXPIRE = re.compile(r'/expire/(\d+)')
+
+
+class StreamUrlCache:
+    """Cache of resolved streams keyed by video URL, honouring googlevideo expiry.
+
+    Cached values are stream objects exposing the direct media URL as `.url`.
+    """
+
+    def __init__(self, max_entries: int = None, expiry_margin: float = None, default_ttl: float = None):
+        self.max_entries = max_entries or Config.STREAM_CACHE_SIZE
+        self.expiry_margin = Config.STREAM_EXPIRY_MARGIN if expiry_margin is None else expiry_margin
+        self.default_ttl = default_ttl or Config.STREAM_DEFAULT_TTL
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @staticmethod
+    def parse_expiry(stream_url: str) -> Optional[float]:
+        """Return the unix timestamp a googlevideo URL stops working, if present."""
+        try:
+            parsed = urlparse(stream_url)
+            expire = parse_qs(parsed.query).get('expire')
+            if expire:
+                return float(expire[0])
+            match = _PATH_EXPIRE.search(parsed.path)
+            if match:
+                return float(match.group(1))
+        except ValueError:
+            pass
+        return None
+
+    def put(self, url: str, stream):
+        expires_at = self.parse_expiry(stream.url) or (time.time() + self.default_ttl)
+        self._entries[url] = (stream, expires_at)
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, url: str):
+        """Return a cached stream that is not within the expiry margin, else None."""
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        stream, expires_at = entry
+        if expires_at - self.expiry_margin <= time.time():
+            del self._entries[url]
+            return None
+        self._entries.move_to_end(url)
+        return stream
+
+    def is_fresh(self, url: str) -> bool:
+        entry = self._entries.get(url)
+        return entry is not None and entry[1] - self.expiry_margin > time.time()
+
+    def invalidate(self, url: str):
+        self._entries.pop(url, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class StreamPrefetcher:
+    """Resolve streams ahead of playback and share in-flight resolutions."""
+
+    def __init__(self, resolve: Callable[[str], Awaitable],
+                 cache: StreamUrlCache = None, concurrency: int = None):
+        self.resolve = resolve
+        self.cache = cache or StreamUrlCache()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._semaphore = asyncio.Semaphore(concurrency or Config.PREFETCH_CONCURRENCY)
+
+    async def get_stream(self, url: str):
+        """Return a warm stream if available, otherwise resolve it now."""
+        stream = self.cache.get(url)
+        metrics.record_cache('stream', stream is not None)
+        if stream:
+            return stream
+        task = self._in_flight.get(url)
+        if task is None:
+            task = self._start(url, background=False)
+        return await asyncio.shield(task)
+
+    def prefetch(self, urls: Iterable[str]):
+        """Schedule background resolution for URLs that are missing or close to expiry."""
+        for url in urls:
+            if url and url not in self._in_flight and not self.cache.is_fresh(url):
+                self._start(url, background=True)
+
+    def invalidate(self, url: str):
+        self.cache.invalidate(url)
+
+    def _start(self, url: str, background: bool) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(self._resolve(url, background))
+        self._in_flight[url] = task
+        task.add_done_callback(lambda t: self._in_flight.pop(url, None))
+        return task
+
+    async def _resolve(self, url: str, background: bool):
+        try:
+            if background:
+                # Keep prefetching from crowding out extractions for the track about to play
+                async with self._semaphore:
+                    stream = await self.resolve(url)
+            else:
+                stream = await self.resolve(url)
+        except Exception as e:
+            print(f"Stream prefetch error: {e}")
+            return None
+        if stream:
+            self.cache.put(url, stream)
+        return stream
@@ -0,0 +1,190 @@
+import asyncio
+import bisect
+import heapq
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set
+from config import Config
+from youtube_api import YouTubeMusicAPI
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case, accent-folded word tokens of a title or query."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return re.findall(r'\w+', text)
+
+
+class _Entry:
+    __slots__ = ('song', 'label', 'tokens', 'plays', 'last_played')
+
+    def __init__(self, song: Dict, plays: int = 0, last_played: float = 0.0):
+        title = YouTubeMusicAPI._clean_title(song.get('title', '')) or song.get('title', '')
+        artist = YouTubeMusicAPI._clean_artist(song.get('artist', ''))
+        self.song = song
+        self.label = f"{title} — {artist}" if artist else title
+        # The raw title's words too, so partially typed noise like "(official" still matches
+        self.tokens = set(tokenize(f"{artist} {title} {song.get('title', '')}"))
+        self.plays = plays
+        self.last_played = last_played
+
+
+class TrackIndex:
+    """In-memory prefix index over known tracks, for slash-command autocomplete.
+
+    Every word of a track's cleaned title and artist is a token; a query matches
+    tracks that have, for each query word, a token starting with it. Tokens are
+    kept in a sorted list so a prefix is a bisect range. Played tracks are
+    persisted to SQLite (with their play counts) and rank above tracks only
+    seen in the search cache. Lookups never touch the disk.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or Config.TRACK_INDEX_PATH
+        self._entries: Dict[str, _Entry] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._tokens: List[str] = []
+        self._lock = threading.Lock()
+        # Separate from _lock so a slow commit never holds up autocomplete lookups
+        self._db_lock = threading.Lock()
+        self._db = self._open_db()
+
+    def _open_db(self) -> Optional[sqlite3.Connection]:
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS played_tracks ("
+                "video_id TEXT PRIMARY KEY, title TEXT NOT NULL, artist TEXT NOT NULL, "
+                "thumbnail TEXT NOT NULL, duration INTEGER, plays INTEGER NOT NULL, last_played REAL NOT NULL)"
+            )
+            db.commit()
+            return db
+        except Exception as e:
+            print(f"Played-track history disabled ({self.path}): {e}")
+            return None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, cached_songs: Iterable[Dict] = ()):
+        """Index the played-track history, then songs from the search cache (run in a thread)."""
+        entries = []
+        if self._db is not None:
+            with self._db_lock:
+                rows = self._db.execute(
+                    "SELECT video_id, title, artist, thumbnail, duration, plays, last_played FROM played_tracks"
+                ).fetchall()
+            for video_id, title, artist, thumbnail, duration, plays, last_played in rows:
+                song = {'id': video_id, 'title': title, 'artist': artist,
+                        'thumbnail': thumbnail, 'duration': duration}
+                entries.append(_Entry(song, plays, last_played))
+        entries.extend(_Entry(song) for song in cached_songs if song.get('id'))
+        with self._lock:
+            for entry in entries:
+                if entry.song['id'] not in self._entries:
+                    self._add(entry, sort=False)
+            self._tokens.sort()
+
+    async def record_play(self, song: Dict):
+        """Index a track that just started playing and count the play.
+
+        The in-memory index is updated at once; the history write runs in a worker thread.
+        """
+        song = {k: song.get(k) for k in ('id', 'title', 'artist', 'thumbnail', 'duration')}
+        now = time.time()
+        with self._lock:
+            old = self._entries.get(song['id'])
+            self._add(_Entry(song, (old.plays if old else 0) + 1, now))
+        await asyncio.to_thread(self._save_play, song, now)
+
+    def _save_play(self, song: Dict, now: float):
+        with self._db_lock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT INTO played_tracks (video_id, title, artist, thumbnail, duration, plays, last_played) "
+                    "VALUES (?, ?, ?, ?, ?, 1, ?) ON CONFLICT(video_id) DO UPDATE SET "
+                    "title = excluded.title, artist = excluded.artist, thumbnail = excluded.thumbnail, "
+                    "duration = excluded.duration, plays = plays + 1, last_played = excluded.last_played",
+                    (song['id'], song['title'] or '', song['artist'] or '', song['thumbnail'] or '',
+                     song['duration'], now),
+                )
+                self._db.commit()
+            except Exception as e:
+                print(f"Error writing played-track history: {e}")
+
+    def get(self, video_id: str) -> Optional[Dict]:
+        """The song dict for an indexed video, or None."""
+        entry = self._entries.get(video_id)
+        return dict(entry.song) if entry else None
+
+    def search(self, query: str, limit: int = 25) -> List[Dict]:
+        """Up to `limit` matching songs, most played (then most recent) first; each has a 'label'."""
+        words = tokenize(query)
+        with self._lock:
+            if not words:
+                candidates = self._entries.keys()
+            else:
+                candidates = None
+                # Longest words first: they match the fewest tracks
+                for word in sorted(set(words), key=len, reverse=True):
+                    matches = self._prefix_matches(word)
+                    candidates = matches if candidates is None else candidates & matches
+                    if not candidates:
+                        return []
+            best = heapq.nsmallest(
+                limit, candidates,
+                key=lambda vid: (-self._entries[vid].plays, -self._entries[vid].last_played, self._entries[vid].label),
+            )
+            return [dict(self._entries[vid].song, label=self._entries[vid].label) for vid in best]
+
+    def _prefix_matches(self, prefix: str) -> Set[str]:
+        start = bisect.bisect_left(self._tokens, prefix)
+        end = bisect.bisect_left(self._tokens, prefix + '\U0010ffff', start)
+        if end - start == 1:
+            return set(self._postings[self._tokens[start]])
+        matches: Set[str] = set()
+        for token in self._tokens[start:end]:
+            matches |= self._postings[token]
+        return matches
+
+    def _add(self, entry: _Entry, sort: bool = True):
+        """Insert or replace an entry, keeping the postings and token list in step.
+
+        Bulk loads pass sort=False and sort the token list once at the end.
+        """
+        video_id = entry.song['id']
+        old = self._entries.get(video_id)
+        old_tokens = old.tokens if old else set()
+        for token in old_tokens - entry.tokens:
+            postings = self._postings[token]
+            postings.discard(video_id)
+            if not postings:
+                del self._postings[token]
+                del self._tokens[bisect.bisect_left(self._tokens, token)]
+        for token in entry.tokens - old_tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                if sort:
+                    bisect.insort(self._tokens, token)
+                else:
+                    self._tokens.append(token)
+            postings.add(video_id)
+        self._entries[video_id] = entry
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,137 @@
+import itertools
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+class Track:
+    """A queued song. The watch URL is derived from the video ID rather than stored."""
+
+    __slots__ = ('id', 'title', 'artist', 'thumbnail', 'duration', 'requested_by', '_queue_line')
+
+    def __init__(self, id: str, title: str = '', artist: str = '', thumbnail: str = '',
+                 duration: Optional[int] = None, requested_by: str = ''):
+        self.id = id
+        self.title = title
+        self.artist = artist
+        self.thumbnail = thumbnail
+        self.duration = duration
+        self.requested_by = requested_by
+        self._queue_line: Optional[str] = None
+
+    @property
+    def url(self) -> str:
+        return f"https://www.youtube.com/watch?v={self.id}"
+
+    @property
+    def duration_text(self) -> str:
+        if self.duration is None:
+            return "?:??"
+        return f"{self.duration//60}:{self.duration%60:02d}"
+
+    @property
+    def queue_line(self) -> str:
+        """Queue listing text for this track, formatted once and reused on every render."""
+        if self._queue_line is None:
+            self._queue_line = f"**{self.title}** — {self.artist} | {self.duration_text}"
+        return self._queue_line
+
+    @classmethod
+    def from_dict(cls, data: Dict, requested_by: str = None) -> 'Track':
+        """Build a Track from a song dict (API result or saved queue entry)."""
+        return cls(
+            data['id'],
+            data.get('title', ''),
+            data.get('artist', ''),
+            data.get('thumbnail', ''),
+            data.get('duration'),
+            requested_by if requested_by is not None else data.get('requested_by', ''),
+        )
+
+    def to_dict(self) -> Dict:
+        """Song dict in the original queue.json format."""
+        return {
+            'id': self.id,
+            'title': self.title,
+            'artist': self.artist,
+            'thumbnail': self.thumbnail,
+            'duration': self.duration,
+            'url': self.url,
+            'requested_by': self.requested_by,
+        }
+
+    def __repr__(self):
+        return f"Track({self.id!r}, {self.title!r})"
+
+
+class TrackQueue:
+    """Deque-backed play queue with O(1) head removal and cheap positional edits.
+
+    Positional operations use 0-based indexes. deque insert/delete walk from the
+    nearer end in C, so edits near either end of very large queues stay fast.
+    """
+
+    def __init__(self, tracks: Iterable[Track] = ()):
+        self._tracks = deque(tracks)
+
+    @classmethod
+    def from_dicts(cls, songs: Iterable[Dict]) -> 'TrackQueue':
+        return cls(Track.from_dict(s) for s in songs)
+
+    def to_dicts(self) -> List[Dict]:
+        return [t.to_dict() for t in self._tracks]
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def __iter__(self) -> Iterator[Track]:
+        return iter(self._tracks)
+
+    def __getitem__(self, index: int) -> Track:
+        return self._tracks[index]
+
+    def append(self, track: Track):
+        self._tracks.append(track)
+
+    def extend(self, tracks: Iterable[Track]):
+        self._tracks.extend(tracks)
+
+    def popleft(self) -> Track:
+        return self._tracks.popleft()
+
+    def insert(self, index: int, track: Track):
+        self._tracks.insert(index, track)
+
+    def remove_at(self, index: int) -> Track:
+        track = self._tracks[index]
+        del self._tracks[index]
+        return track
+
+    def move(self, from_index: int, to_index: int) -> Track:
+        track = self.remove_at(from_index)
+        self._tracks.insert(to_index, track)
+        return track
+
+    def reorder(self, order: List[int]):
+        """Rearrange tracks so position i holds the track previously at order[i]."""
+        tracks = list(self._tracks)
+        self._tracks = deque(tracks[i] for i in order)
+
+    def peek(self, count: int, start: int = 0) -> List[Track]:
+        """Return up to `count` tracks starting at `start` without removing them."""
+        return list(itertools.islice(self._tracks, start, start + count))
+
+    def page(self, start: int, count: int) -> List[Track]:
+        """Like peek(), but walks from whichever end of the deque is nearer to `start`."""
+        size = len(self._tracks)
+        start = max(0, start)
+        if start >= size:
+            return []
+        end = min(size, start + count)
+        if start <= size - end:
+            return list(itertools.islice(self._tracks, start, end))
+        tail = list(itertools.islice(reversed(self._tracks), size - end, size - start))
+        tail.reverse()
+        return tail
+
+    def clear(self):
+        self._tracks.clear()
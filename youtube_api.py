@@ -1,80 +1,192 @@
-import requests
+import asyncio
+import aiohttp
 import re
+import threading
 import json
-from typing import Dict, List, Optional
+import metrics
+from typing import AsyncIterator, Container, Dict, Iterator, List, Optional
 from config import Config
-from ytmusicapi import YTMusic
+from quota import PRIORITY_BACKGROUND, PRIORITY_USER, QuotaExceeded, QuotaTracker
+from metadata_resolver import MAX_IDS_PER_REQUEST, AsyncVideoMetadataResolver, VideoMetadataResolver
+from related_graph import RelatedGraph
+from resilience import Backend, BackendUnavailable, Hedge
+from search_cache import SearchCache
 
 class YouTubeMusicAPI:
     def __init__(self):
         self.api_key = Config.YOUTUBE_API_KEY
         self.base_url = "https://www.googleapis.com/youtube/v3"
-        self.ytmusic = YTMusic()
-        
+        # ytmusicapi and requests are slow to import, so both clients are created on first use
+        self._ytmusic = None
+        self._http = None
+        self._client_lock = threading.Lock()
+        self.metadata = VideoMetadataResolver(self._fetch_videos)
+        self.search_cache = SearchCache(normalize=self._normalize_query)
+        self.related_graph = RelatedGraph()
+        self.quota = QuotaTracker()
+
+    @property
+    def ytmusic(self):
+        """The YouTube Music client, created on first use."""
+        if self._ytmusic is None:
+            with self._client_lock:
+                if self._ytmusic is None:
+                    from ytmusicapi import YTMusic
+                    self._ytmusic = YTMusic()
+        return self._ytmusic
+
+    @ytmusic.setter
+    def ytmusic(self, client):
+        self._ytmusic = client
+
+    @property
+    def http(self):
+        """Pooled requests session for the Data API, created on first use."""
+        if self._http is None:
+            with self._client_lock:
+                if self._http is None:
+                    import requests
+                    self._http = requests.Session()
+        return self._http
+
+    def warm(self):
+        """Create the YouTube Music client ahead of the first radio or search fallback (blocking)."""
+        return self.ytmusic
+
     def search_song(self, query: str, max_results: int = 5) -> List[Dict]:
         """Search for songs on YouTube Music"""
+        cached = self.search_cache.get(query, max_results)
+        if cached is not None:
+            return cached
         try:
-            # Use YouTube Data API v3 for search
-            search_url = f"{self.base_url}/search"
-            params = {
-                'part': 'snippet',
-                'q': query,
-                'type': 'video',
-                'maxResults': max_results,
-                'key': self.api_key,
-                'videoCategoryId': '10'  # Music category
-            }
-            
-            response = requests.get(search_url, params=params)
-            response.raise_for_status()
-            
-            results = []
-            for item in response.json().get('items', []):
-                video_id = item['id']['videoId']
-                snippet = item['snippet']
-                
-                # Extract duration from video details
-                duration = self._get_video_duration(video_id)
-                
-                results.append({
-                    'id': video_id,
-                    'title': snippet['title'],
-                    'artist': snippet['channelTitle'],
-                    'thumbnail': snippet['thumbnails']['medium']['url'],
-                    'duration': duration,
-                    'url': f"https://www.youtube.com/watch?v={video_id}"
-                })
-            
+            try:
+                # Use YouTube Data API v3 for search
+                data = self._get_json('search', self._search_params(query, max_results))
+            except QuotaExceeded as e:
+                print(f"Data API budget low, searching YouTube Music instead: {e}")
+                results = self._ytmusic_search(query, max_results)
+            else:
+                items = data.get('items', [])
+                # Resolve all durations with a single videos.list call
+                details = self.metadata.resolve(item['id']['videoId'] for item in items)
+                results = [self._song_from_search_item(item, details) for item in items]
+
+            self.search_cache.put(query, max_results, results)
             return results
-            
+
         except Exception as e:
             print(f"Error searching for song: {e}")
             return []
-    
+
+    def _get_json(self, endpoint: str, params: Dict, priority: str = PRIORITY_USER) -> Dict:
+        """GET a Data API endpoint over the pooled session and decode the JSON body.
+
+        The call is charged to the daily quota first (and refunded if no response
+        arrives); QuotaExceeded is raised when the budget (or the API itself)
+        says there is not enough left.
+        """
+        self.quota.acquire(endpoint, priority)
+        try:
+            response = self.http.get(f"{self.base_url}/{endpoint}", params=params,
+                                     timeout=Config.HTTP_TIMEOUT)
+        except Exception:
+            self.quota.refund(endpoint)
+            raise
+        finally:
+            self.quota.save()
+        if response.status_code == 403 and self._is_quota_error(response.json()):
+            self.quota.exhaust()
+            self.quota.save()
+            raise QuotaExceeded("YouTube Data API daily quota exhausted")
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _is_quota_error(data: Dict) -> bool:
+        errors = (data.get('error') or {}).get('errors') or []
+        return any(e.get('reason') in ('quotaExceeded', 'dailyLimitExceeded') for e in errors)
+
+    def _ytmusic_search(self, query: str, max_results: int) -> List[Dict]:
+        """Quota-free search through YouTube Music."""
+        return self._songs_from_ytmusic_items(
+            self.ytmusic.search(query, filter='songs', limit=max_results), max_results
+        )
+
+    def _songs_from_ytmusic_items(self, items: List[Dict], max_results: int) -> List[Dict]:
+        results = []
+        for item in items:
+            vid = item.get('videoId')
+            if not vid:
+                continue
+            thumbnails = item.get('thumbnails') or []
+            results.append({
+                'id': vid,
+                'title': item.get('title', ''),
+                'artist': ", ".join(a['name'] for a in (item.get('artists') or [])),
+                'thumbnail': thumbnails[0]['url'] if thumbnails else "",
+                'duration': item.get('duration_seconds') or self._parse_length(item.get('duration')),
+                'url': f"https://www.youtube.com/watch?v={vid}"
+            })
+            if len(results) >= max_results:
+                break
+        return results
+
+    def _search_params(self, query: str, max_results: int) -> Dict:
+        return {
+            'part': 'snippet',
+            'q': query,
+            'type': 'video',
+            'maxResults': max_results,
+            'key': self.api_key,
+            'videoCategoryId': '10'  # Music category
+        }
+
+    def _videos_params(self, video_ids: List[str]) -> Dict:
+        return {
+            'part': 'snippet,contentDetails',
+            'id': ','.join(video_ids),
+            'maxResults': len(video_ids),
+            'key': self.api_key
+        }
+
+    def _song_from_search_item(self, item: Dict, details: Dict[str, Optional[Dict]]) -> Dict:
+        """Build a song dict from a search result and its resolved video details"""
+        video_id = item['id']['videoId']
+        snippet = item['snippet']
+        info = details.get(video_id)
+        return {
+            'id': video_id,
+            'title': snippet['title'],
+            'artist': snippet['channelTitle'],
+            'thumbnail': snippet['thumbnails']['medium']['url'],
+            'duration': info['duration'] if info else None,
+            'url': f"https://www.youtube.com/watch?v={video_id}"
+        }
+
     def _get_video_duration(self, video_id: str) -> Optional[int]:
         """Get video duration in seconds"""
-        try:
-            url = f"{self.base_url}/videos"
-            params = {
-                'part': 'contentDetails',
-                'id': video_id,
-                'key': self.api_key
+        info = self.metadata.resolve([video_id]).get(video_id)
+        return info['duration'] if info else None
+
+    def _fetch_videos(self, video_ids: List[str]) -> Dict[str, Dict]:
+        """Fetch details for up to 50 videos with one videos.list request"""
+        data = self._get_json('videos', self._videos_params(video_ids))
+        return self._videos_from_response(data)
+
+    def _videos_from_response(self, data: Dict) -> Dict[str, Dict]:
+        videos = {}
+        for item in data.get('items', []):
+            snippet = item['snippet']
+            videos[item['id']] = {
+                'id': item['id'],
+                'title': snippet['title'],
+                'artist': snippet['channelTitle'],
+                'thumbnail': snippet['thumbnails']['medium']['url'],
+                'duration': self._parse_duration(item['contentDetails']['duration']),
+                'url': f"https://www.youtube.com/watch?v={item['id']}"
             }
-            
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            
-            items = response.json().get('items', [])
-            if items:
-                duration_str = items[0]['contentDetails']['duration']
-                return self._parse_duration(duration_str)
-            
-            return None
-            
-        except Exception as e:
-            print(f"Error getting video duration: {e}")
-            return None
-    
+        return videos
+
     def _parse_duration(self, duration_str: str) -> int:
         """Parse ISO 8601 duration format to seconds"""
         # Remove PT prefix
@@ -100,38 +212,52 @@ class YouTubeMusicAPI:
     
     def get_video_info(self, video_id: str) -> Optional[Dict]:
         """Get detailed information about a specific video"""
+        info = self.metadata.resolve([video_id]).get(video_id)
+        return dict(info) if info else None
+
+    def iter_playlist(self, playlist_id: str) -> Iterator[List[Dict]]:
+        """Yield a playlist's songs one page (up to 50) at a time.
+
+        Each page costs one playlistItems call plus one batched videos.list call
+        for durations. Private or deleted entries are left out.
+        """
+        page_token = None
         try:
-            url = f"{self.base_url}/videos"
-            params = {
-                'part': 'snippet,contentDetails',
-                'id': video_id,
-                'key': self.api_key
-            }
-            
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            
-            items = response.json().get('items', [])
-            if items:
-                item = items[0]
-                snippet = item['snippet']
-                duration = self._parse_duration(item['contentDetails']['duration'])
-                
-                return {
-                    'id': video_id,
-                    'title': snippet['title'],
-                    'artist': snippet['channelTitle'],
-                    'thumbnail': snippet['thumbnails']['medium']['url'],
-                    'duration': duration,
-                    'url': f"https://www.youtube.com/watch?v={video_id}"
-                }
-            
-            return None
-            
-        except Exception as e:
-            print(f"Error getting video info: {e}")
-            return None
-    
+            while True:
+                data = self._get_json('playlistItems', self._playlist_params(playlist_id, page_token))
+                ids = self._playlist_video_ids(data)
+                details = self.metadata.resolve(ids)
+                yield [dict(details[vid]) for vid in ids if details.get(vid)]
+                page_token = data.get('nextPageToken')
+                if not page_token:
+                    return
+        except QuotaExceeded as e:
+            if page_token is None:
+                print(f"Data API budget low, loading playlist from YouTube Music instead: {e}")
+                yield self._songs_from_ytmusic_items(
+                    self.ytmusic.get_playlist(playlist_id, limit=None).get('tracks', []), Config.MAX_QUEUE_SIZE
+                )
+            else:
+                print(f"Playlist import stopped early: {e}")
+
+    def _playlist_params(self, playlist_id: str, page_token: str = None) -> Dict:
+        params = {
+            'part': 'contentDetails',
+            'playlistId': playlist_id,
+            'maxResults': MAX_IDS_PER_REQUEST,
+            'key': self.api_key,
+        }
+        if page_token:
+            params['pageToken'] = page_token
+        return params
+
+    @staticmethod
+    def _playlist_video_ids(data: Dict) -> List[str]:
+        return [
+            item['contentDetails']['videoId'] for item in data.get('items', [])
+            if item.get('contentDetails', {}).get('videoId')
+        ]
+
     _TITLE_NOISE = re.compile(
         r'[\(\[]\s*(?:Official\s*(?:Music\s*)?Video|Official\s*Audio|'
         r'Lyric(?:s)?\s*Video|Audio\s*(?:Only)?|HD|HQ|4K|MV|M/V|'
@@ -146,6 +272,19 @@ class YouTubeMusicAPI:
         title = re.sub(r'\s{2,}', ' ', title).strip()
         return title
 
+    # Pure noise only: version qualifiers such as (Live), (Remix) or (Explicit) pick a different track
+    _QUERY_NOISE = re.compile(
+        r'[\(\[]\s*(?:Official\s*(?:Music\s*)?Video|Official\s*Audio|Lyric(?:s)?(?:\s*Video)?|'
+        r'HD|HQ|4K)\s*[\)\]]',
+        re.IGNORECASE,
+    )
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """Normalise a search query so equivalent searches share a cache entry."""
+        query = YouTubeMusicAPI._QUERY_NOISE.sub('', query)
+        return re.sub(r'\s+', ' ', query).strip().lower()
+
     @staticmethod
     def _clean_artist(artist: str) -> str:
         """Strip VEVO / '- Topic' suffixes from channel names."""
@@ -170,47 +309,64 @@ class YouTubeMusicAPI:
         return None
 
     def get_related_songs(self, video_id: str, max_results: int = 5,
-                          title: str = None, artist: str = None) -> List[Dict]:
+                          title: str = None, artist: str = None,
+                          exclude: Container[str] = ()) -> List[Dict]:
         """Get similar songs using YouTube Music's radio algorithm.
 
-        Falls back to keyword search if ytmusicapi fails.
+        Served from the related-track graph while its node is fresh; otherwise
+        refetched (falling back to keyword search if ytmusicapi fails). Songs
+        whose IDs are in `exclude` are skipped.
         """
-        try:
-            result = self.ytmusic.get_watch_playlist(videoId=video_id, limit=max_results + 5)
-            tracks = result.get("tracks", [])
-
-            results = []
-            for t in tracks:
-                vid = t.get("videoId")
-                if not vid or vid == video_id:
-                    continue
-                duration = self._parse_length(t.get("length"))
-                if duration is not None and duration > Config.MAX_SONG_DURATION:
-                    continue
-                thumbnails = t.get("thumbnail") or []
-                thumb_url = thumbnails[0]["url"] if thumbnails else ""
-                artists = ", ".join(a["name"] for a in (t.get("artists") or []))
-                results.append({
-                    'id': vid,
-                    'title': t.get("title", ""),
-                    'artist': artists,
-                    'thumbnail': thumb_url,
-                    'duration': duration,
-                    'url': f"https://www.youtube.com/watch?v={vid}"
-                })
-                if len(results) >= max_results:
-                    break
+        related, fresh = self.related_graph.get(video_id)
+        if not fresh:
+            related = self._fetch_related(video_id, title, artist) or related or []
+        return self._pick_related(related, max_results, exclude)
 
+    def _fetch_related(self, video_id: str, title: str = None, artist: str = None) -> List[Dict]:
+        try:
+            result = self.ytmusic.get_watch_playlist(videoId=video_id, limit=Config.RELATED_FANOUT + 5)
+            results = self._songs_from_watch_playlist(result, video_id, Config.RELATED_FANOUT)
             if results:
+                self.related_graph.put(video_id, results, 'radio')
                 return results
         except Exception as e:
             print(f"ytmusicapi radio failed, falling back to keyword search: {e}")
 
-        return self._get_related_songs_fallback(video_id, max_results, title, artist)
+        return self._get_related_songs_fallback(video_id, Config.RELATED_FANOUT, title, artist)
+
+    @staticmethod
+    def _pick_related(related: List[Dict], max_results: int, exclude: Container[str] = ()) -> List[Dict]:
+        picked = [dict(song) for song in related if song['id'] not in exclude]
+        return picked[:max_results]
+
+    def _songs_from_watch_playlist(self, result: Dict, video_id: str, max_results: int) -> List[Dict]:
+        """Convert a ytmusicapi watch playlist into song dicts within the duration limit."""
+        results = []
+        for t in result.get("tracks", []):
+            vid = t.get("videoId")
+            if not vid or vid == video_id:
+                continue
+            duration = self._parse_length(t.get("length"))
+            if duration is not None and duration > Config.MAX_SONG_DURATION:
+                continue
+            thumbnails = t.get("thumbnail") or []
+            thumb_url = thumbnails[0]["url"] if thumbnails else ""
+            artists = ", ".join(a["name"] for a in (t.get("artists") or []))
+            results.append({
+                'id': vid,
+                'title': t.get("title", ""),
+                'artist': artists,
+                'thumbnail': thumb_url,
+                'duration': duration,
+                'url': f"https://www.youtube.com/watch?v={vid}"
+            })
+            if len(results) >= max_results:
+                break
+        return results
 
     def _get_related_songs_fallback(self, video_id: str, max_results: int = 5,
                                     title: str = None, artist: str = None) -> List[Dict]:
-        """Fallback: keyword search via YouTube Data API."""
+        """Fallback: keyword search via YouTube Data API (YouTube Music when the budget is low)."""
         try:
             if not title:
                 info = self.get_video_info(video_id)
@@ -219,48 +375,66 @@ class YouTubeMusicAPI:
                 title = info['title']
                 artist = info.get('artist', '')
 
-            query = self._clean_title(title)
-            if artist:
-                clean_artist = self._clean_artist(artist)
-                if clean_artist:
-                    query = f"{clean_artist} {query}"
-
-            search_url = f"{self.base_url}/search"
-            params = {
-                'part': 'snippet',
-                'q': query,
-                'type': 'video',
-                'maxResults': max_results + 5,
-                'key': self.api_key,
-                'videoCategoryId': '10',
-            }
-            response = requests.get(search_url, params=params)
-            response.raise_for_status()
-
-            results = []
-            for item in response.json().get('items', []):
-                vid = item['id'].get('videoId')
-                if not vid or vid == video_id:
-                    continue
-                snippet = item['snippet']
-                duration = self._get_video_duration(vid)
-                if duration is None or duration > Config.MAX_SONG_DURATION:
-                    continue
-                results.append({
-                    'id': vid,
-                    'title': snippet['title'],
-                    'artist': snippet['channelTitle'],
-                    'thumbnail': snippet['thumbnails']['medium']['url'],
-                    'duration': duration,
-                    'url': f"https://www.youtube.com/watch?v={vid}"
-                })
-                if len(results) >= max_results:
-                    break
+            query = self._related_query(title, artist)
+            try:
+                data = self._get_json('search', self._search_params(query, max_results + 5),
+                                      priority=PRIORITY_BACKGROUND)
+            except QuotaExceeded:
+                songs = self._ytmusic_search(query, max_results + 5)
+                results = self._filter_related_songs(songs, video_id, max_results)
+            else:
+                items = self._related_search_items(data, video_id)
+                details = self.metadata.resolve(item['id']['videoId'] for item in items)
+                results = self._filter_related(items, details, max_results)
+            self.related_graph.put(video_id, results, 'search')
             return results
         except Exception as e:
             print(f"Error getting related songs: {e}")
             return []
 
+    def _related_query(self, title: str, artist: str = None) -> str:
+        """Build a keyword query from a cleaned title and artist."""
+        query = self._clean_title(title)
+        if artist:
+            clean_artist = self._clean_artist(artist)
+            if clean_artist:
+                query = f"{clean_artist} {query}"
+        return query
+
+    @staticmethod
+    def _related_search_items(data: Dict, video_id: str) -> List[Dict]:
+        return [
+            item for item in data.get('items', [])
+            if item['id'].get('videoId') and item['id']['videoId'] != video_id
+        ]
+
+    def _filter_related(self, items: List[Dict], details: Dict[str, Optional[Dict]],
+                        max_results: int) -> List[Dict]:
+        """Keep search results with a known duration within the limit."""
+        results = []
+        for item in items:
+            song = self._song_from_search_item(item, details)
+            if song['duration'] is None or song['duration'] > Config.MAX_SONG_DURATION:
+                continue
+            results.append(song)
+            if len(results) >= max_results:
+                break
+        return results
+
+    @staticmethod
+    def _filter_related_songs(songs: List[Dict], video_id: str, max_results: int) -> List[Dict]:
+        """Same filtering as _filter_related, for song dicts from YouTube Music search."""
+        return [
+            song for song in songs
+            if song['id'] != video_id and song['duration'] is not None
+            and song['duration'] <= Config.MAX_SONG_DURATION
+        ][:max_results]
+
+    def extract_playlist_id(self, url: str) -> Optional[str]:
+        """Extract the playlist ID from a YouTube or YouTube Music URL"""
+        match = re.search(r'[?&]list=([\w-]+)', url)
+        return match.group(1) if match else None
+
     def extract_video_id(self, url: str) -> Optional[str]:
         """Extract video ID from YouTube URL"""
         patterns = [
@@ -274,3 +448,216 @@ class YouTubeMusicAPI:
                 return match.group(1)
         
         return None
+
+
+class AsyncYouTubeMusicAPI(YouTubeMusicAPI):
+    """Non-blocking variant of YouTubeMusicAPI for use on the bot's event loop.
+
+    Data API calls share one aiohttp session with keep-alive connection pooling;
+    ytmusicapi calls (which are blocking) run in worker threads. Each upstream
+    has a circuit breaker and latency budget, and searches and radio lookups
+    hedge against the other source when the preferred one is slow.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.metadata = AsyncVideoMetadataResolver(self._fetch_videos)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.data_api_backend = Backend('data_api', Config.HTTP_TIMEOUT, is_failure=self._is_backend_failure)
+        self.ytmusic_backend = Backend('ytmusic', Config.YTMUSIC_TIMEOUT)
+        self.search_hedge = Hedge('search')
+        self.related_hedge = Hedge('related')
+
+    async def start(self):
+        """Open the pooled HTTP session (safe to call more than once)."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=Config.HTTP_POOL_SIZE,
+                limit_per_host=Config.HTTP_MAX_PER_HOST,
+                keepalive_timeout=Config.HTTP_KEEPALIVE,
+            )
+            timeout = aiohttp.ClientTimeout(total=Config.HTTP_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def close(self):
+        """Close the HTTP session and its pooled connections."""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self.search_cache.close()
+        self.related_graph.close()
+
+    async def _get_json(self, endpoint: str, params: Dict, priority: str = PRIORITY_USER) -> Dict:
+        self.quota.acquire(endpoint, priority)
+        await self.start()
+        try:
+            data = await self.data_api_backend.call(endpoint, lambda: self._request(endpoint, params))
+        except (BackendUnavailable, asyncio.TimeoutError, aiohttp.ClientConnectionError):
+            # The request was never sent or never answered: it cost nothing
+            self.quota.refund(endpoint)
+            raise
+        finally:
+            await asyncio.to_thread(self.quota.save)
+        if data is None:
+            self.quota.exhaust()
+            await asyncio.to_thread(self.quota.save)
+            raise QuotaExceeded("YouTube Data API daily quota exhausted")
+        return data
+
+    @staticmethod
+    def _is_backend_failure(error: Exception) -> bool:
+        """4xx answers (a deleted playlist, a bad page token) mean a bad request, not a failing API."""
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status >= 500 or error.status == 429
+        return True
+
+    async def _request(self, endpoint: str, params: Dict) -> Optional[Dict]:
+        """GET a Data API endpoint; None when the API reports the daily quota as exhausted."""
+        async with self._session.get(f"{self.base_url}/{endpoint}", params=params) as response:
+            if response.status == 403 and self._is_quota_error(await response.json(content_type=None)):
+                return None
+            response.raise_for_status()
+            return await response.json()
+
+    async def _call_ytmusic(self, method: str, *args, **kwargs):
+        """Run a YouTube Music client method in a worker thread.
+
+        The client is looked up there too: the first use builds it, which imports
+        ytmusicapi and does setup I/O.
+        """
+        return await asyncio.to_thread(lambda: getattr(self.ytmusic, method)(*args, **kwargs))
+
+    async def _ytmusic_search(self, query: str, max_results: int) -> List[Dict]:
+        items = await self.ytmusic_backend.call('ytmusic_search', lambda: self._call_ytmusic(
+            'search', query, filter='songs', limit=max_results
+        ))
+        return self._songs_from_ytmusic_items(items, max_results)
+
+    async def search_song(self, query: str, max_results: int = 5) -> List[Dict]:
+        """Search for songs on YouTube Music"""
+        with metrics.SEARCH_LATENCY.time():
+            return await self._search_song(query, max_results)
+
+    async def _search_song(self, query: str, max_results: int) -> List[Dict]:
+        cached = await asyncio.to_thread(self.search_cache.get, query, max_results)
+        metrics.record_cache('search', cached is not None)
+        if cached is not None:
+            return cached
+        try:
+            # Data API first (its ranking matches YouTube's); YouTube Music when it is slow or out of budget
+            results = await self.search_hedge.run(
+                lambda: self._data_api_search(query, max_results),
+                lambda: self._ytmusic_search(query, max_results),
+            )
+            await asyncio.to_thread(self.search_cache.put, query, max_results, results)
+            return results
+
+        except Exception as e:
+            print(f"Error searching for song: {e}")
+            return []
+
+    async def _data_api_search(self, query: str, max_results: int) -> List[Dict]:
+        data = await self._get_json('search', self._search_params(query, max_results))
+        items = data.get('items', [])
+        details = await self.metadata.resolve(item['id']['videoId'] for item in items)
+        return [self._song_from_search_item(item, details) for item in items]
+
+    async def _get_video_duration(self, video_id: str) -> Optional[int]:
+        info = (await self.metadata.resolve([video_id])).get(video_id)
+        return info['duration'] if info else None
+
+    async def _fetch_videos(self, video_ids: List[str]) -> Dict[str, Dict]:
+        data = await self._get_json('videos', self._videos_params(video_ids))
+        return self._videos_from_response(data)
+
+    async def get_video_info(self, video_id: str) -> Optional[Dict]:
+        """Get detailed information about a specific video"""
+        info = (await self.metadata.resolve([video_id])).get(video_id)
+        return dict(info) if info else None
+
+    async def iter_playlist(self, playlist_id: str) -> AsyncIterator[List[Dict]]:
+        """Yield a playlist's songs one page (up to 50) at a time.
+
+        Each page costs one playlistItems call plus one batched videos.list call
+        for durations. Private or deleted entries are left out.
+        """
+        page_token = None
+        try:
+            while True:
+                data = await self._get_json('playlistItems', self._playlist_params(playlist_id, page_token))
+                ids = self._playlist_video_ids(data)
+                details = await self.metadata.resolve(ids)
+                yield [dict(details[vid]) for vid in ids if details.get(vid)]
+                page_token = data.get('nextPageToken')
+                if not page_token:
+                    return
+        except QuotaExceeded as e:
+            if page_token is None:
+                print(f"Data API budget low, loading playlist from YouTube Music instead: {e}")
+                result = await self._call_ytmusic('get_playlist', playlist_id, limit=None)
+                yield self._songs_from_ytmusic_items(result.get('tracks', []), Config.MAX_QUEUE_SIZE)
+            else:
+                print(f"Playlist import stopped early: {e}")
+
+    async def get_related_songs(self, video_id: str, max_results: int = 5,
+                                title: str = None, artist: str = None,
+                                exclude: Container[str] = ()) -> List[Dict]:
+        """Get similar songs using YouTube Music's radio algorithm.
+
+        Served from the related-track graph while its node is fresh; otherwise
+        refetched (falling back to keyword search if ytmusicapi fails). Songs
+        whose IDs are in `exclude` are skipped.
+        """
+        related, fresh = await asyncio.to_thread(self.related_graph.get, video_id)
+        metrics.record_cache('related', fresh)
+        if not fresh:
+            related = await self._fetch_related(video_id, title, artist) or related or []
+        return self._pick_related(related, max_results, exclude)
+
+    async def _fetch_related(self, video_id: str, title: str = None, artist: str = None) -> List[Dict]:
+        # YouTube Music radio first; keyword search when it is slow, failing or empty
+        try:
+            return await self.related_hedge.run(
+                lambda: self._fetch_radio(video_id),
+                lambda: self._get_related_songs_fallback(video_id, Config.RELATED_FANOUT, title, artist),
+            )
+        except Exception as e:
+            print(f"Error getting related songs: {e}")
+            return []
+
+    async def _fetch_radio(self, video_id: str) -> List[Dict]:
+        result = await self.ytmusic_backend.call('ytmusic_watch', lambda: self._call_ytmusic(
+            'get_watch_playlist', videoId=video_id, limit=Config.RELATED_FANOUT + 5
+        ))
+        results = self._songs_from_watch_playlist(result, video_id, Config.RELATED_FANOUT)
+        if results:
+            await asyncio.to_thread(self.related_graph.put, video_id, results, 'radio')
+        return results
+
+    async def _get_related_songs_fallback(self, video_id: str, max_results: int = 5,
+                                          title: str = None, artist: str = None) -> List[Dict]:
+        """Fallback: keyword search via YouTube Data API (YouTube Music when the budget is low)."""
+        try:
+            if not title:
+                info = await self.get_video_info(video_id)
+                if not info:
+                    return []
+                title = info['title']
+                artist = info.get('artist', '')
+
+            query = self._related_query(title, artist)
+            try:
+                data = await self._get_json('search', self._search_params(query, max_results + 5),
+                                            priority=PRIORITY_BACKGROUND)
+            except QuotaExceeded:
+                songs = await self._ytmusic_search(query, max_results + 5)
+                results = self._filter_related_songs(songs, video_id, max_results)
+            else:
+                items = self._related_search_items(data, video_id)
+                details = await self.metadata.resolve(item['id']['videoId'] for item in items)
+                results = self._filter_related(items, details, max_results)
+            await asyncio.to_thread(self.related_graph.put, video_id, results, 'search')
+            return results
+        except Exception as e:
+            print(f"Error getting related songs: {e}")
+            return []